@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Benchmark the game loop without a terminal: level generation, get_view, turns, and
+whole frames drawn into a headless screen
+
+Run from the repository root with `python3 benchmarks/bench_headless.py`. Everything runs
+in its own Session with a HeadlessColorRegistry, so curses is never started.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import events
+import keyinput
+import mapgenfuncs
+import rockslike
+from session import Session
+from gameworld import GameWorld
+from gameworld_quarrydepths import QuarryDepthsGameMap
+from headless import HeadlessWindow, HeadlessColorRegistry
+from renderer import DiffRenderer
+
+MOVE_KEYS = "hjklyubn"
+
+def timed(function, count):
+    """Call function count times and return the calls per second"""
+    start = time.perf_counter()
+    for i in range(count):
+        function(i)
+    return count / (time.perf_counter() - start)
+
+def bench_generation(args):
+    """Levels of the default Quarry Depths size generated per second"""
+    gameworld = GameWorld(genfunc=mapgenfuncs.empty_box, width=20, height=20)
+    return timed(lambda i: QuarryDepthsGameMap(gameworld, rng=random.Random(args.seed + i)),
+                 args.levels)
+
+def bench_get_view(args, gameworld):
+    """get_view calls per second for a screen-sized view following the player"""
+    height, width = args.screen_size
+    return timed(lambda i: gameworld.get_view(view_width=width, view_height=height, center_on_player=True),
+                 args.views)
+
+def bench_turns(args, gameworld):
+    """Keys handled and turns simulated per second, without drawing anything"""
+    rng = random.Random(args.seed)
+    keys = [rng.choice(MOVE_KEYS) for i in range(args.turns)]
+    def turn(i):
+        keyinput.handle_key(keys[i])
+        gameworld.update_world()
+        events.flush_events()
+    return timed(turn, args.turns)
+
+def bench_frames(args, session, gameworld):
+    """Whole frames per second: a turn, then panels, get_view and the diff renderer
+    drawing into a headless screen
+    """
+    rng = random.Random(args.seed)
+    keys = [rng.choice(MOVE_KEYS) for i in range(args.frames)]
+    stdscr = HeadlessWindow(*args.screen_size)
+    gamewindow, panellist = rockslike.layout_panels(stdscr, session=session)
+    gamerenderer = DiffRenderer(gamewindow, session=session)
+    def frame(i):
+        rockslike.draw_screen(stdscr, gameworld, gamerenderer, panellist, doupdate=stdscr.doupdate)
+        keyinput.handle_key(keys[i])
+        gameworld.update_world()
+        events.flush_events()
+    return timed(frame, args.frames)
+
+def run(args):
+    """Run every benchmark in a fresh headless session and return (name, rate, unit) rows"""
+    session = Session(color_registry=HeadlessColorRegistry())
+    with session.activate():
+        events.set_deferred(True)
+        results = [("generation", bench_generation(args), "levels/s")]
+        gameworld = GameWorld(genfunc=mapgenfuncs.empty_box, width=args.map_size, height=args.map_size,
+                              seed=args.seed, session=session)
+        results.append(("get_view", bench_get_view(args, gameworld), "views/s"))
+        results.append(("turns", bench_turns(args, gameworld), "turns/s"))
+        results.append(("frames", bench_frames(args, session, gameworld), "frames/s"))
+    return results
+
+def get_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for levels and keys")
+    parser.add_argument("--map-size", type=int, default=500, help="Width and height of the map played on")
+    parser.add_argument("--screen-size", type=rockslike.parse_screen_size, default=(40, 120),
+            metavar="ROWSxCOLS", help="Size of the headless screen")
+    parser.add_argument("--levels", type=int, default=50, help="Levels to generate")
+    parser.add_argument("--views", type=int, default=2000, help="get_view calls to make")
+    parser.add_argument("--turns", type=int, default=20000, help="Turns to simulate")
+    parser.add_argument("--frames", type=int, default=2000, help="Frames to draw")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = get_args()
+    results = run(args)
+    print("{0:>11} {1:>12}".format("benchmark", "rate"))
+    for name, rate, unit in results:
+        print("{0:>11} {1:>12.1f} {2}".format(name, rate, unit))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Benchmark composing BSP rooms into a map: union_mapfeatures versus MapCanvas stamping
+
+Run from the repository root with `python3 benchmarks/bench_mapgen.py`.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import mapgenfuncs
+import mapcomponents
+
+SIZES = [(75, 50), (500, 500), (2000, 2000)]
+
+def compose_union(roomlist):
+    """Build a map the old way, reallocating the whole grid for every room"""
+    mapfeatures = [[]]
+    for room in roomlist:
+        mapfeatures = mapgenfuncs.union_mapfeatures(mapfeatures, room.mapfeatures, room.w_x, room.w_y)
+    return mapfeatures
+
+def compose_canvas(roomlist, width, height):
+    """Build a map by stamping every room into one preallocated canvas"""
+    canvas = mapcomponents.MapCanvas(width, height)
+    for room in roomlist:
+        canvas.stamp(room)
+    return canvas.mapfeatures
+
+def run(args):
+    """Time both approaches at each size and return a list of result rows"""
+    results = []
+    for width, height in SIZES:
+        roomlist = mapgenfuncs.bsp(mapcomponents.Room, width, height, rng=random.Random(args.seed))
+
+        start = time.perf_counter()
+        compose_canvas(roomlist, width, height)
+        canvas_time = time.perf_counter() - start
+
+        #union_mapfeatures is too slow to run over every room of a big map, so time
+        #as many rooms as fit in the budget and extrapolate from there
+        start = time.perf_counter()
+        mapfeatures = [[]]
+        rooms_done = 0
+        for room in roomlist:
+            mapfeatures = mapgenfuncs.union_mapfeatures(mapfeatures, room.mapfeatures, room.w_x, room.w_y)
+            rooms_done += 1
+            if time.perf_counter() - start > args.union_budget:
+                break
+        union_time = (time.perf_counter() - start) * len(roomlist) / rooms_done
+
+        results.append((width, height, len(roomlist), rooms_done, union_time, canvas_time))
+    return results
+
+def get_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for room generation")
+    parser.add_argument("--union-budget", type=float, default=10.0,
+            help="Seconds to spend timing union_mapfeatures at each size before extrapolating")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = get_args()
+    results = run(args)
+    print("{0:>11} {1:>6} {2:>12} {3:>12} {4:>8}".format("size", "rooms", "union (s)", "canvas (s)", "speedup"))
+    for width, height, rooms, rooms_done, union_time, canvas_time in results:
+        estimate = "~" if rooms_done < rooms else " "
+        print("{0:>11} {1:>6} {2}{3:>11.4f} {4:>12.4f} {5:>7.0f}x".format(
+            "{0}x{1}".format(width, height), rooms, estimate, union_time, canvas_time,
+            union_time / canvas_time))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Benchmark parsemap.parse_file on big generated maps
+
+Run from the repository root with `python3 benchmarks/bench_parsemap.py`. Each map is a
+walled room of floor with some pillars, stairs, feature overrides and entities sprinkled
+through it.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import parsemap
+
+SIZES = [(500, 500), (1000, 1000), (2000, 1000), (2000, 2000)]
+
+def make_map_text(width, height, rng, override_count, entity_count):
+    """Return the text of a width x height map file"""
+    rows = [list("#" * width)]
+    for y in range(height-2):
+        rows.append(list("#" + "." * (width-2) + "#"))
+    rows.append(list("#" * width))
+    for i in range(width*height // 100):
+        rows[rng.randrange(1, height-1)][rng.randrange(1, width-1)] = rng.choice("#>")
+
+    mapfeatures = {}
+    for i in range(override_count):
+        x, y = rng.randrange(1, width-1), rng.randrange(1, height-1)
+        mapfeatures["{0},{1}".format(x, y)] = {"classname": "Wall", "tilechar": "X", "fgcolor": "RED"}
+    entities = []
+    for i in range(entity_count):
+        entities.append({"classname": "ItemPickup",
+                         "x_coord": rng.randrange(1, width-1),
+                         "y_coord": rng.randrange(1, height-1),
+                         "args": [["Pebble"]]})
+    trailer = {"mapdetails": {"version": 0, "player_spawn_x": 1, "player_spawn_y": 1},
+               "mapfeatures": mapfeatures,
+               "entities": entities}
+    return "\n".join("".join(row) for row in rows) + "\n\n" + json.dumps(trailer, indent=4)
+
+def run(args):
+    """Time parse_file at each size and return a list of result rows"""
+    results = []
+    for width, height in SIZES:
+        text = make_map_text(width, height, random.Random(args.seed), args.overrides, args.entities)
+        times = []
+        for i in range(args.repeat):
+            start = time.perf_counter()
+            parsemap.parse_file(io.StringIO(text))
+            times.append(time.perf_counter() - start)
+        results.append((width, height, len(text), min(times)))
+    return results
+
+def get_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for map contents")
+    parser.add_argument("--overrides", type=int, default=1000, help="Feature overrides per map")
+    parser.add_argument("--entities", type=int, default=10000, help="Entities per map")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per size; the fastest is reported")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = get_args()
+    results = run(args)
+    print("{0:>11} {1:>10} {2:>10}".format("size", "MB", "parse (s)"))
+    for width, height, length, parse_time in results:
+        print("{0:>11} {1:>10.2f} {2:>10.4f}".format("{0}x{1}".format(width, height), length/1e6, parse_time))
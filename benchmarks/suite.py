@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""Benchmark the game's hot paths at several scales and compare against a stored baseline
+
+Run from the repository root with `python3 benchmarks/suite.py`. Each case is timed at
+a range of scales (map size, entity count, listener count or message length) and the
+results are printed as a scaling curve: the time per call at each scale, and how much it
+grew from the scale before. Every result is then compared to benchmarks/baseline.json,
+and the script exits with status 1 if anything got slower by more than --tolerance.
+
+Baselines only mean something on the machine that recorded them. After a deliberate
+change in performance, or on a new machine, record a new one with --save-baseline.
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import events
+import parsemap
+import entities
+import mapgenfuncs
+import mapcomponents
+import pathfinding
+from tile import Tile
+from session import Session
+from gameworld import GameWorld
+from headless import HeadlessWindow, HeadlessColorRegistry
+from screenpanels import TextPanel
+from bench_parsemap import make_map_text
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+VIEW_SIZE = (120, 40)
+
+def box_with_entities(gw, width, height, entity_count, rng=random):
+    """An empty_box with entity_count plain entities scattered over its floor"""
+    world, map_entities, player_spawn = mapgenfuncs.empty_box(gw, width, height, rng=rng)
+    tile = Tile('k', foreground="GREEN")
+    for i in range(entity_count):
+        x, y = rng.randrange(1, width-1), rng.randrange(1, height-1)
+        map_entities.append(entities.Entity(tile, x, y, gw.get))
+    return world, map_entities, player_spawn
+
+def make_gameworld(size, entity_count, seed):
+    return GameWorld(genfunc=box_with_entities, width=size, height=size,
+                     entity_count=entity_count, seed=seed)
+
+## CASES ##
+#Each takes a scale and the parsed arguments, and returns a function to time
+
+def case_get_view_by_map_size(size, args):
+    gameworld = make_gameworld(size, 1000, args.seed)
+    return lambda: gameworld.get_view(*VIEW_SIZE, center_on_player=True)
+
+def case_get_view_by_entities(entity_count, args):
+    gameworld = make_gameworld(500, entity_count, args.seed)
+    return lambda: gameworld.get_view(*VIEW_SIZE, center_on_player=True)
+
+def case_get_by_entities(entity_count, args):
+    gameworld = make_gameworld(500, entity_count, args.seed)
+    rng = random.Random(args.seed)
+    cells = [(rng.randrange(500), rng.randrange(500)) for i in range(1000)]
+    def get_cells():
+        for x, y in cells:
+            gameworld.get(x, y)
+    return get_cells
+
+def case_find_path_by_map_size(size, args):
+    gameworld = make_gameworld(size, 0, args.seed)
+    goal = (gameworld.width-2, gameworld.height-2)
+    return lambda: gameworld.find_path((1, 1), goal)
+
+def case_distance_map_by_map_size(size, args):
+    gameworld = make_gameworld(size, 0, args.seed)
+    passability = gameworld._grid.get_passability()
+    width, height = gameworld.width, gameworld.height
+    return lambda: pathfinding.DistanceMap(passability, width, height, [(width//2, height//2)])
+
+def case_next_step_by_walkers(walker_count, args):
+    gameworld = make_gameworld(500, 0, args.seed)
+    rng = random.Random(args.seed)
+    walkers = [(rng.randrange(1, 501), rng.randrange(1, 501)) for i in range(walker_count)]
+    target = [(gameworld._player.x, gameworld._player.y)]
+    gameworld.get_distance_map(target)
+    def step_walkers():
+        #The distance map is cached, so this is what every turn after the first costs
+        distance_map = gameworld.get_distance_map(target)
+        for x, y in walkers:
+            distance_map.next_step(x, y)
+    return step_walkers
+
+def case_bsp_union(size, args):
+    def generate():
+        roomlist = mapgenfuncs.bsp(mapcomponents.Room, size, size, rng=random.Random(args.seed))
+        mapfeatures = [[]]
+        for room in roomlist:
+            mapfeatures = mapgenfuncs.union_mapfeatures(mapfeatures, room.mapfeatures, room.w_x, room.w_y)
+    return generate
+
+def case_bsp_canvas(size, args):
+    def generate():
+        roomlist = mapgenfuncs.bsp(mapcomponents.Room, size, size, rng=random.Random(args.seed))
+        canvas = mapcomponents.MapCanvas(size, size)
+        for room in roomlist:
+            canvas.stamp(room)
+    return generate
+
+def case_parse_file(size, args):
+    text = make_map_text(size, size, random.Random(args.seed), size, size)
+    return lambda: parsemap.parse_file(io.StringIO(text))
+
+class _Listener():
+    def on_event(self, *args):
+        pass
+
+def case_trigger_event(listener_count, args):
+    eventname = "bench_event_{0}".format(listener_count)
+    listeners = [_Listener() for i in range(listener_count)]
+    for listener in listeners:
+        events.listen_to_event(eventname, listener.on_event)
+    def trigger():
+        events.trigger_event(eventname, 1, 2)
+    #The bus only holds weak references to the listeners
+    trigger.listeners = listeners
+    return trigger
+
+def case_trim_message(word_count, args):
+    panel = TextPanel(HeadlessWindow(40, 90))
+    rng = random.Random(args.seed)
+    message = " ".join("".join(rng.choice("abcdefghij") for i in range(rng.randrange(1, 10)))
+                       for word in range(word_count))
+    return lambda: panel._trim_message(message)
+
+#name -> (case function, scales, what the scale measures)
+CASES = {
+    "get_view/map_size": (case_get_view_by_map_size, (100, 500, 2000), "map width and height"),
+    "get_view/entities": (case_get_view_by_entities, (0, 1000, 10000, 100000), "entities"),
+    "get/entities": (case_get_by_entities, (0, 1000, 10000, 100000), "entities, 1000 lookups"),
+    "find_path/map_size": (case_find_path_by_map_size, (50, 100, 500), "map width and height, corner to corner"),
+    "distance_map/map_size": (case_distance_map_by_map_size, (50, 100, 500), "map width and height"),
+    "next_step/walkers": (case_next_step_by_walkers, (1, 100, 1000), "walkers sharing one distance map"),
+    "bsp+union/map_size": (case_bsp_union, (50, 100, 200), "map width and height"),
+    "bsp+canvas/map_size": (case_bsp_canvas, (50, 100, 200, 1000), "map width and height"),
+    "parse_file/map_size": (case_parse_file, (100, 300, 1000), "map width and height"),
+    "trigger_event/listeners": (case_trigger_event, (1, 10, 100, 1000), "listeners"),
+    "trim_message/words": (case_trim_message, (10, 100, 1000), "words"),
+}
+
+def time_call(function, min_time, repeat):
+    """Return the best seconds per call over repeat rounds, each calling function as many
+    times as fit in min_time seconds
+    """
+    #Find a number of calls that takes at least min_time
+    calls = 1
+    while True:
+        start = time.perf_counter()
+        for i in range(calls):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        calls *= 2 if elapsed == 0 else max(2, int(min_time / elapsed * 1.2))
+    best = elapsed / calls
+    for r in range(repeat - 1):
+        start = time.perf_counter()
+        for i in range(calls):
+            function()
+        best = min(best, (time.perf_counter() - start) / calls)
+    return best
+
+def run(args):
+    """Time every selected case at each of its scales and return {case: {scale: seconds}}"""
+    results = {}
+    session = Session(color_registry=HeadlessColorRegistry())
+    with session.activate():
+        for name, (case, scales, scale_name) in CASES.items():
+            if args.only and not any(pattern in name for pattern in args.only):
+                continue
+            results[name] = {}
+            for scale in scales:
+                results[name][str(scale)] = time_call(case(scale, args), args.min_time, args.repeat)
+    return results
+
+def format_time(seconds):
+    for unit, factor in (("s", 1), ("ms", 1e3), ("us", 1e6)):
+        if seconds * factor >= 1:
+            return "{0:.3g}{1}".format(seconds * factor, unit)
+    return "{0:.3g}ns".format(seconds * 1e9)
+
+def report(results, baseline, tolerance):
+    """Print each case's scaling curve next to the baseline and return the regressions"""
+    regressions = []
+    for name, timings in results.items():
+        print("{0} (scale: {1})".format(name, CASES[name][2]))
+        print("  {0:>8} {1:>10} {2:>8} {3:>10} {4:>8}".format("scale", "per call", "growth", "baseline", "change"))
+        previous = None
+        for scale, seconds in timings.items():
+            growth = "" if previous is None else "{0:.2f}x".format(seconds / previous)
+            previous = seconds
+            base = baseline.get(name, {}).get(scale)
+            if base is None:
+                base_str, change = "-", ""
+            else:
+                base_str = format_time(base)
+                change = "{0:+.0%}".format(seconds / base - 1)
+                if seconds > base * (1 + tolerance):
+                    change += " !"
+                    regressions.append((name, scale, base, seconds))
+            print("  {0:>8} {1:>10} {2:>8} {3:>10} {4:>8}".format(scale, format_time(seconds), growth, base_str, change))
+    return regressions
+
+def get_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("only", nargs='*', help="Only run cases whose names contain one of these")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for maps, entities and messages")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds to spend on each round of calls")
+    parser.add_argument("--repeat", type=int, default=3, help="Rounds per scale; the fastest is reported")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+            help="How much slower than the baseline counts as a regression (default 0.25: 25%%)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file to compare against")
+    parser.add_argument("--save-baseline", action="store_true",
+            help="Store these results in the baseline file (merged with any cases not run)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = get_args()
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results = run(args)
+    regressions = report(results, baseline, args.tolerance)
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+        print("Saved baseline to {0}".format(args.baseline))
+    elif len(regressions) > 0:
+        print("{0} regression(s) over {1:.0%}:".format(len(regressions), args.tolerance))
+        for name, scale, base, seconds in regressions:
+            print("  {0} at {1}: {2} -> {3}".format(name, scale, format_time(base), format_time(seconds)))
+        sys.exit(1)
@@ -0,0 +1,92 @@
+"""A module for compact per-cell flags, like which cells of a map the player has seen
+
+A CellBitset keeps one bit per cell of a width x height map, with each row stored as a
+single Python int whose bit x is the flag for column x. That makes OR-ing a whole set of
+cells in (such as everything in a field of view) one operation per row, and pulling out a
+row for drawing a shift and a mask. Pickled, a CellBitset is width*height/8 bytes.
+"""
+
+#Turns the '0's and '1's of a binary string into 0 and 1 bytes
+_BITS_TO_BYTES = bytes.maketrans(b"01", b"\x00\x01")
+
+def get_row_masks(cells, width, x=0):
+    """Return {y: mask} for an iterable of cells given as y*width + x, with bit n of each
+    row's mask set for the cell in column x+n of that row, ready for CellBitset.update_rows.
+    Every cell has to be in column x or to the right of it.
+    """
+    masks = {}
+    for index in cells:
+        y, cell_x = divmod(index, width)
+        masks[y] = masks.get(y, 0) | 1 << (cell_x - x)
+    return masks
+
+def unpack_row(mask, width):
+    """Return bytes with one byte per bit of the lowest width bits of mask, lowest first:
+    1 where the bit is set and 0 where it isn't
+    """
+    if mask == 0:
+        return bytes(width)
+    #format puts the lowest bit last, so reverse it to run left to right
+    return format(mask, "0{0}b".format(width))[::-1].encode("ascii").translate(_BITS_TO_BYTES)
+
+class CellBitset():
+    """One bit for each cell of a width x height map, all clear to begin with"""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self._rows = [0] * height
+
+    def __contains__(self, cell):
+        x, y = cell
+        return self._rows[y] >> x & 1 == 1
+
+    def add(self, x, y):
+        """Set the bit for the cell at x, y"""
+        self._rows[y] |= 1 << x
+
+    def update_rows(self, row_masks, x=0):
+        """Set every bit in row_masks, a {y: mask} dict as from get_row_masks, whose
+        bit 0 is column x
+        """
+        rows = self._rows
+        for y, mask in row_masks.items():
+            rows[y] |= mask << x
+
+    def __ior__(self, other):
+        if (other.width, other.height) != (self.width, self.height):
+            raise ValueError("Can't combine a {0}x{1} CellBitset with a {2}x{3} one".format(
+                self.width, self.height, other.width, other.height))
+        self._rows = [row | other_row for row, other_row in zip(self._rows, other._rows)]
+        return self
+
+    def get_row(self, y, x, width):
+        """Return bytes with one byte per cell for width cells of row y starting at x:
+        1 where the bit is set, 0 where it isn't or where the row has ended
+        """
+        return unpack_row(self._rows[y] >> x & ((1 << width) - 1), width)
+
+    def count(self):
+        """Return how many bits are set"""
+        return sum(bin(row).count("1") for row in self._rows)
+
+    def to_bytes(self):
+        """Return the bits packed row by row, each row padded to a whole number of bytes"""
+        row_bytes = (self.width + 7) // 8
+        return b"".join(row.to_bytes(row_bytes, "little") for row in self._rows)
+
+    @classmethod
+    def from_bytes(cls, width, height, data):
+        """Rebuild a CellBitset from what to_bytes returned"""
+        bitset = cls(width, height)
+        row_bytes = (width + 7) // 8
+        bitset._rows = [int.from_bytes(data[start:start+row_bytes], "little")
+                        for start in range(0, row_bytes*height, row_bytes)]
+        return bitset
+
+    def __getstate__(self):
+        return (self.width, self.height, self.to_bytes())
+
+    def __setstate__(self, state):
+        width, height, data = state
+        self.__dict__.update(CellBitset.from_bytes(width, height, data).__dict__)
@@ -0,0 +1,326 @@
+"""A module for maps too big to hold in memory all at once
+
+A ChunkedMapGrid splits a map into square chunks, each with its own small MapGrid, and
+only keeps the chunks near the player in memory. A chunk is generated the first time
+anything looks at it, and written out to a ChunkStore (along with the entities standing
+in it and which of its cells the player has seen) when the player moves out of range,
+to be loaded again if they come back. It answers the same calls as a MapGrid, so a
+GameMap, and the GameWorld around it, don't need to know the map is chunked.
+
+The per-cell layers other parts of the game keep, such as opacity for field of view and
+passability for collisions and pathfinding, are ChunkLayers: they index like the flat
+bytearrays a MapGrid hands out, but their bytes are kept per chunk, and come and go with
+the chunks. Whatever walks the whole map at once, like a pathfinding.DistanceMap or the
+pad renderer, would bring every chunk into memory, so OverworldGameWorld refuses to
+pathfind and rockslike refuses --pad with --overworld.
+"""
+import os
+import pickle
+import random
+import tempfile
+
+import entities
+import mapfeatures
+from mapgrid import MapGrid
+from bitset import CellBitset
+from levelcache import derive_seed
+
+class Chunk():
+    """One square of a ChunkedMapGrid: its features, the cells of it the player has seen,
+    and, while it's stored away, the entities that were standing in it
+    """
+
+    def __init__(self, grid, chunk_entities=()):
+        self.grid = grid
+        self.seen = CellBitset(grid.width, grid.height)
+        self.entities = list(chunk_entities)
+
+class ChunkStore():
+    """A directory of pickled chunks. Without a directory, chunks go in a temporary one
+    that is deleted along with the store.
+    """
+
+    def __init__(self, directory=None):
+        if directory is None:
+            self._temp_dir = tempfile.TemporaryDirectory(prefix="rockslike-chunks-")
+            directory = self._temp_dir.name
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def load(self, chunk_x, chunk_y):
+        """Return the stored Chunk at chunk_x, chunk_y, or None if it was never stored"""
+        try:
+            with open(self._get_path(chunk_x, chunk_y), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def store(self, chunk_x, chunk_y, chunk):
+        with open(self._get_path(chunk_x, chunk_y), "wb") as f:
+            pickle.dump(chunk, f, pickle.HIGHEST_PROTOCOL)
+
+    ## PRIVATE METHODS ##
+    def _get_path(self, chunk_x, chunk_y):
+        return os.path.join(self.directory, "{0}_{1}.chunk".format(chunk_x, chunk_y))
+
+class ChunkedMapGrid():
+    """A width_chunks x height_chunks grid of chunk_size x chunk_size chunks, generated
+    lazily and kept in memory only while they're near the player
+
+    genfunc: Builds a chunk. Called as genfunc(chunk_x, chunk_y, chunk_size, rng=rng), it
+        returns a chunk_size x chunk_size 2d list of mapfeatures and a list of entities
+        placed in map coordinates, like the map generation functions in mapgenfuncs.
+    seed: Each chunk's rng is seeded from this and the chunk's position
+    load_radius: How many chunks around the player's to keep in memory (see update_residency)
+    directory: Where to store chunks that go out of range, or None for a temporary directory
+    """
+
+    def __init__(self, genfunc, width_chunks, height_chunks, chunk_size=64, seed=0,
+                 load_radius=1, directory=None):
+        self.genfunc = genfunc
+        self.chunk_size = chunk_size
+        self.width = width_chunks * chunk_size
+        self.height = height_chunks * chunk_size
+        self.seed = seed
+        self.load_radius = load_radius
+        self.store = ChunkStore(directory)
+        #Id 0 is Void, as in a MapGrid; nothing else is shared across chunks
+        self.tiles = [mapfeatures.Void().tile]
+        #(chunk x, chunk y) -> Chunk, for the chunks in memory
+        self._chunks = {}
+        #The ChunkLayers to tell when chunks come and go
+        self._layers = []
+        #The GameMap that entities in chunks are put on when they load
+        self.gamemap = None
+        #How many chunks have been generated, loaded from the store, and stored
+        self.generated = 0
+        self.loaded = 0
+        self.stored = 0
+
+    def __getstate__(self):
+        raise TypeError("A ChunkedMapGrid keeps most of its map on disk and can't be pickled")
+
+    def attach_map(self, gamemap):
+        """Put the entities of every chunk loaded from now on onto gamemap"""
+        self.gamemap = gamemap
+        for chunk in self._chunks.values():
+            self._add_entities(chunk)
+
+    def get(self, x, y):
+        """Return the MapFeature at x, y"""
+        chunk_x, local_x = divmod(x, self.chunk_size)
+        chunk_y, local_y = divmod(y, self.chunk_size)
+        return self.get_chunk(chunk_x, chunk_y).grid.get(local_x, local_y)
+
+    def set(self, x, y, feature):
+        """Replace the MapFeature at x, y"""
+        chunk_x, local_x = divmod(x, self.chunk_size)
+        chunk_y, local_y = divmod(y, self.chunk_size)
+        self.get_chunk(chunk_x, chunk_y).grid.set(local_x, local_y, feature)
+
+    def get_tile_rows(self, x, y, width, height):
+        """Return a height x width 2d list of the tiles of the features in the rectangle
+        whose upper left corner is at x, y, as MapGrid.get_tile_rows does
+        """
+        size = self.chunk_size
+        rows = []
+        for row_y in range(y, y + height):
+            chunk_y, local_y = divmod(row_y, size)
+            row = []
+            column = x
+            while column < x + width:
+                chunk_x, local_x = divmod(column, size)
+                run = min(size - local_x, x + width - column)
+                chunk_grid = self.get_chunk(chunk_x, chunk_y).grid
+                row.extend(chunk_grid.get_tile_rows(local_x, local_y, run, 1)[0])
+                column += run
+            rows.append(row)
+        return rows
+
+    def get_opacity(self):
+        """Return a ChunkLayer which is 1 where the feature in a cell is opaque"""
+        return ChunkLayer(self, MapGrid.get_opacity)
+
+    def get_passability(self):
+        """Return a ChunkLayer which is 1 where the feature in a cell is passable"""
+        return ChunkLayer(self, MapGrid.get_passability)
+
+    def new_bitset(self):
+        """Return a ChunkedBitset of the cells the player has seen, which is stored with
+        the chunks
+        """
+        return ChunkedBitset(self)
+
+    def add_layer(self, layer):
+        """Start telling layer when chunks come and go, starting with the ones in memory"""
+        for chunk_pos, chunk in self._chunks.items():
+            layer.chunk_loaded(chunk_pos, chunk)
+        self._layers.append(layer)
+
+    def get_chunk(self, chunk_x, chunk_y):
+        """Return the Chunk at chunk_x, chunk_y, loading or generating it if it isn't in
+        memory
+        """
+        chunk = self._chunks.get((chunk_x, chunk_y))
+        if chunk is None:
+            chunk = self._load_chunk(chunk_x, chunk_y)
+        return chunk
+
+    def get_resident_chunks(self):
+        """Return the (chunk x, chunk y) positions of the chunks in memory"""
+        return list(self._chunks)
+
+    def update_residency(self, x, y):
+        """Load the chunks within load_radius chunks of x, y and store away every other
+        chunk in memory
+        """
+        center_x = x // self.chunk_size
+        center_y = y // self.chunk_size
+        radius = self.load_radius
+        for chunk_pos in list(self._chunks):
+            if max(abs(chunk_pos[0] - center_x), abs(chunk_pos[1] - center_y)) > radius:
+                self._store_chunk(*chunk_pos)
+        for chunk_y in range(max(0, center_y - radius), min(self.height // self.chunk_size, center_y + radius + 1)):
+            for chunk_x in range(max(0, center_x - radius), min(self.width // self.chunk_size, center_x + radius + 1)):
+                self.get_chunk(chunk_x, chunk_y)
+
+    ## PRIVATE METHODS ##
+    def _load_chunk(self, chunk_x, chunk_y):
+        chunk = self.store.load(chunk_x, chunk_y)
+        if chunk is not None:
+            self.loaded += 1
+        else:
+            rng = random.Random(derive_seed(self.seed, "{0},{1}".format(chunk_x, chunk_y)))
+            features, chunk_entities = self.genfunc(chunk_x, chunk_y, self.chunk_size, rng=rng)
+            chunk = Chunk(MapGrid(features), chunk_entities)
+            self.generated += 1
+        self._chunks[(chunk_x, chunk_y)] = chunk
+        for layer in self._layers:
+            layer.chunk_loaded((chunk_x, chunk_y), chunk)
+        if self.gamemap is not None:
+            self._add_entities(chunk)
+        return chunk
+
+    def _add_entities(self, chunk):
+        for entity in chunk.entities:
+            self.gamemap.add_entity(entity)
+        chunk.entities = []
+
+    def _store_chunk(self, chunk_x, chunk_y):
+        chunk = self._chunks[(chunk_x, chunk_y)]
+        if self.gamemap is not None:
+            size = self.chunk_size
+            for entity in self.gamemap.entity_index.in_rect(chunk_x*size, chunk_y*size, size, size):
+                #The player goes wherever the map goes
+                if not isinstance(entity, entities.Player):
+                    self.gamemap.remove_entity(entity)
+                    chunk.entities.append(entity)
+        self.store.store(chunk_x, chunk_y, chunk)
+        self.stored += 1
+        for layer in self._layers:
+            layer.chunk_dropped((chunk_x, chunk_y))
+        del self._chunks[(chunk_x, chunk_y)]
+
+class ChunkLayer():
+    """One byte per cell of a ChunkedMapGrid, indexed by y*width + x like a bytearray, but
+    kept per chunk and built from each chunk's MapGrid as it loads. Bytes written to it
+    last until the chunk is stored away, so a layer should only hold things that can be
+    worked out again from the chunk's features and entities.
+
+    build: Called with a chunk's MapGrid, returns the layer's bytearray for that chunk
+    """
+
+    def __init__(self, chunked_grid, build):
+        self._grid = chunked_grid
+        self._build = build
+        self._width = chunked_grid.width
+        self._size = chunked_grid.chunk_size
+        #(chunk x, chunk y) -> bytearray of the chunk's cells, row by row
+        self._chunks = {}
+        chunked_grid.add_layer(self)
+
+    def __len__(self):
+        return self._width * self._grid.height
+
+    def __getitem__(self, index):
+        data, local_index = self._locate(index)
+        return data[local_index]
+
+    def __setitem__(self, index, value):
+        data, local_index = self._locate(index)
+        data[local_index] = value
+
+    def chunk_loaded(self, chunk_pos, chunk):
+        self._chunks[chunk_pos] = self._build(chunk.grid)
+
+    def chunk_dropped(self, chunk_pos):
+        del self._chunks[chunk_pos]
+
+    ## PRIVATE METHODS ##
+    def _locate(self, index):
+        """Return the chunk bytearray holding the cell at index, and the cell's index in it"""
+        y, x = divmod(index, self._width)
+        size = self._size
+        chunk_x, local_x = divmod(x, size)
+        chunk_y, local_y = divmod(y, size)
+        data = self._chunks.get((chunk_x, chunk_y))
+        if data is None:
+            self._grid.get_chunk(chunk_x, chunk_y)
+            data = self._chunks[(chunk_x, chunk_y)]
+        return data, local_y*size + local_x
+
+class ChunkedBitset():
+    """A bitset.CellBitset over a whole ChunkedMapGrid, made of the seen bits each Chunk
+    carries, so what the player has explored is stored along with the chunks
+    """
+
+    def __init__(self, chunked_grid):
+        self._grid = chunked_grid
+        self.width = chunked_grid.width
+        self.height = chunked_grid.height
+
+    def __contains__(self, cell):
+        x, y = cell
+        size = self._grid.chunk_size
+        chunk_x, local_x = divmod(x, size)
+        chunk_y, local_y = divmod(y, size)
+        return (local_x, local_y) in self._grid.get_chunk(chunk_x, chunk_y).seen
+
+    def add(self, x, y):
+        """Set the bit for the cell at x, y"""
+        size = self._grid.chunk_size
+        chunk_x, local_x = divmod(x, size)
+        chunk_y, local_y = divmod(y, size)
+        self._grid.get_chunk(chunk_x, chunk_y).seen.add(local_x, local_y)
+
+    def update_rows(self, row_masks, x=0):
+        """Set every bit in row_masks, a {y: mask} dict whose bit 0 is column x, splitting
+        each row's mask between the chunks it crosses
+        """
+        size = self._grid.chunk_size
+        for y, mask in row_masks.items():
+            chunk_y, local_y = divmod(y, size)
+            column = x
+            while mask:
+                chunk_x, local_x = divmod(column, size)
+                run = size - local_x
+                part = mask & ((1 << run) - 1)
+                if part:
+                    self._grid.get_chunk(chunk_x, chunk_y).seen.update_rows({local_y: part}, local_x)
+                mask >>= run
+                column += run
+
+    def get_row(self, y, x, width):
+        """Return bytes with one byte per cell for width cells of row y starting at x,
+        as CellBitset.get_row does
+        """
+        size = self._grid.chunk_size
+        chunk_y, local_y = divmod(y, size)
+        pieces = []
+        column = x
+        while column < x + width:
+            chunk_x, local_x = divmod(column, size)
+            run = min(size - local_x, x + width - column)
+            pieces.append(self._grid.get_chunk(chunk_x, chunk_y).seen.get_row(local_y, local_x, run))
+            column += run
+        return b"".join(pieces)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""A module for compiling text maps into a compact binary format and loading them back
+
+Parsing a big text map builds its grid one cell at a time. A compiled map already holds
+the grid as an array of feature ids, so loading one is a single copy out of a
+memory-mapped file, plus building one feature per entry in its feature table.
+
+A compiled map file is laid out as:
+    header - see _HEADER below
+    metadata - a JSON object holding the feature table ([classname, args, kwargs] per
+        feature id, with Void always at id 0), the raw "entities" list from the source
+        map and the player spawn coordinates
+    padding - up to the next multiple of 8 bytes
+    grid - width*height feature ids, row by row
+
+Compile maps with `python3 compiledmap.py maps/*.map`. mapgenfuncs.load_from_file uses
+the compiled copy automatically whenever it is newer than the source map and was written
+in the current format.
+"""
+import os
+import sys
+import json
+import mmap
+import struct
+import argparse
+from array import array
+
+import parsemap
+import mapfeatures
+from mapgrid import MapGrid
+
+MAGIC = b"RLMC"
+FORMAT_VERSION = 1
+COMPILED_EXTENSION = ".mapc"
+
+#magic, format version, array typecode of the ids, byte order of the ids ('l' or 'b'),
+#width, height, length of the metadata in bytes
+_HEADER = struct.Struct("<4sHcc3I")
+_GRID_ALIGNMENT = 8
+
+def get_compiled_path(source_path):
+    """Return where the compiled copy of the map at source_path goes"""
+    return os.path.splitext(source_path)[0] + COMPILED_EXTENSION
+
+def is_up_to_date(source_path):
+    """Return whether the map at source_path has a compiled copy newer than itself, in
+    the current format
+    """
+    compiled_path = get_compiled_path(source_path)
+    try:
+        if os.path.getmtime(compiled_path) < os.path.getmtime(source_path):
+            return False
+        with open(compiled_path, "rb") as compiled_file:
+            magic, version = _HEADER.unpack(compiled_file.read(_HEADER.size))[:2]
+    except (OSError, struct.error):
+        return False
+    return magic == MAGIC and version == FORMAT_VERSION
+
+def compile_map(source_path, compiled_path=None):
+    """Compile the text map at source_path and write it to compiled_path (by default, next
+    to the source with a .mapc extension)
+    """
+    if compiled_path is None:
+        compiled_path = get_compiled_path(source_path)
+    with open(source_path) as source_file:
+        mapart, mapdetails, mapfeatures_by_coord, entities_list = parsemap.read_map_file(source_file)
+
+    width = max((len(line) for line in mapart), default=0)
+    height = len(mapart)
+
+    #Stateless (flyweight) features with the same description share an id. Anything else
+    #gets an id of its own, just like it would get an object of its own from parsemap.
+    feature_table = [["Void", [], {}]]
+    shared_ids = {json.dumps(feature_table[0]): 0}
+    overrides_by_row = parsemap.index_mapfeature_overrides(mapfeatures_by_coord)
+    ids = []
+    for y, line in enumerate(mapart):
+        row_overrides = overrides_by_row.get(y, {})
+        for x, cell in enumerate(line):
+            obj = row_overrides.get(x)
+            mapfeature_class, args, kwargs = parsemap.describe_map_feature(cell, obj)
+            description = [mapfeature_class.__name__, args, kwargs]
+            if mapfeature_class.flyweight:
+                key = json.dumps(description)
+                if key not in shared_ids:
+                    shared_ids[key] = len(feature_table)
+                    feature_table.append(description)
+                ids.append(shared_ids[key])
+            else:
+                ids.append(len(feature_table))
+                feature_table.append(description)
+        ids.extend([0] * (width - len(line)))
+
+    typecode = 'H' if len(feature_table) <= 0xFFFF else 'I'
+    ids = array(typecode, ids)
+    metadata = json.dumps({
+        "features": feature_table,
+        "entities": entities_list,
+        "player_spawn": parsemap.get_player_spawn(mapdetails)
+        }).encode()
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, typecode.encode(), sys.byteorder[0].encode(),
+                          width, height, len(metadata))
+    padding = b"\0" * (-(len(header) + len(metadata)) % _GRID_ALIGNMENT)
+
+    with open(compiled_path, "wb") as compiled_file:
+        compiled_file.write(header)
+        compiled_file.write(metadata)
+        compiled_file.write(padding)
+        ids.tofile(compiled_file)
+
+def load(compiled_path):
+    """Load a compiled map. Return a tuple of a MapGrid, a list of entity constructors
+    (as parsemap.parse_file returns them) and the player spawn coordinates. Raise
+    ValueError if the file isn't a compiled map in the current format, or is cut short.
+    """
+    with open(compiled_path, "rb") as compiled_file, \
+            mmap.mmap(compiled_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        magic, version, typecode, byteorder, width, height, metadata_length = _HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("{0} is not a version {1} compiled map".format(compiled_path, FORMAT_VERSION))
+        metadata_end = _HEADER.size + metadata_length
+        metadata = json.loads(mapped[_HEADER.size:metadata_end])
+        grid_start = metadata_end + (-metadata_end % _GRID_ALIGNMENT)
+
+        ids = array(typecode.decode())
+        with memoryview(mapped) as view:
+            ids.frombytes(view[grid_start:grid_start + width*height*ids.itemsize])
+        if len(ids) != width*height:
+            raise ValueError("{0} is cut short: expected {1} cells, found {2}".format(
+                compiled_path, width*height, len(ids)))
+        if byteorder.decode() != sys.byteorder[0]:
+            ids.byteswap()
+
+    features = [getattr(mapfeatures, classname)(*args, **kwargs)
+                for classname, args, kwargs in metadata["features"]]
+    grid = MapGrid.from_ids(width, height, features, ids)
+    entity_partials = parsemap.parse_entities(metadata["entities"])
+    return (grid, entity_partials, tuple(metadata["player_spawn"]))
+
+def get_args():
+    parser = argparse.ArgumentParser(description="Compile text maps into binary .mapc files")
+    parser.add_argument("mapfiles", nargs='+', help="Paths to text map files")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    for source_path in get_args().mapfiles:
+        compile_map(source_path)
+        print("{0} -> {1}".format(source_path, get_compiled_path(source_path)))
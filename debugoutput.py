@@ -1,25 +1,70 @@
 """A module for printing logging/debugging text to the screen in curses
 
 Curses isn't very print-friendly, unfortunately.
+
+The functions here write to the current DebugBuffer. Each Session has its own, and
+activating a session makes its buffer current (see session.py).
 """
+import contextvars
+
+class DebugBuffer():
+    """Debug strings waiting to be drawn to a curses screen"""
+
+    def __init__(self, stdscr=None):
+        self.stdscr = stdscr
+        self.debug_strings = []
+        #Whether stdscr is a window of the debug text's own, to clear before each flush
+        self._own_window = False
+
+    def set_window(self, window):
+        """Draw debug text into window from now on. Nothing else should draw there, since
+        the window is cleared every flush.
+        """
+        self.stdscr = window
+        self._own_window = True
+
+    def add(self, string):
+        """Add a string to the list of debug strings that will be displayed"""
+        self.debug_strings.append(string)
+
+    def flush(self):
+        """Display the queued debug text to the screen and clear the list"""
+        if self._own_window:
+            #Replace last flush's text, keeping to the window
+            self.stdscr.erase()
+            height, width = self.stdscr.getmaxyx()
+            for y_offset, s in enumerate(self.debug_strings[:height]):
+                self.stdscr.addstr(y_offset, 1, s[:width-2])
+            self.stdscr.noutrefresh()
+        else:
+            y_offset = 0
+            for s in self.debug_strings:
+                self.stdscr.addstr(y_offset, 1, s)
+                y_offset += 1
+        self.debug_strings = []
+
+__current_buffer = contextvars.ContextVar("debug_buffer", default=DebugBuffer())
+
+def get_debug_buffer():
+    """Return the DebugBuffer that the functions in this module use in the current context"""
+    return __current_buffer.get()
+
+def set_debug_buffer(buffer):
+    """Make buffer the current DebugBuffer. Return a token for reset_debug_buffer."""
+    return __current_buffer.set(buffer)
 
-__dbg = {
-        "debug_strings": [],
-        "stdscr": None
-        }
+def reset_debug_buffer(token):
+    """Go back to the DebugBuffer that was current before set_debug_buffer"""
+    __current_buffer.reset(token)
 
 def init(stdscr):
     """Initialize the module"""
-    __dbg["stdscr"] = stdscr
+    get_debug_buffer().stdscr = stdscr
 
 def add_debug_string(string):
     """Add a string to the list of debug strings that will be displayed"""
-    __dbg["debug_strings"].append(string)
+    get_debug_buffer().add(string)
 
 def flush_debug_text():
     """Display the queued debug text to the screen and clear the list"""
-    y_offset = 0
-    for s in __dbg["debug_strings"]:
-        __dbg["stdscr"].addstr(y_offset, 1, s)
-        y_offset += 1
-    __dbg["debug_strings"] = []
+    get_debug_buffer().flush()
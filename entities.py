@@ -1,21 +1,70 @@
 """This module holds creatures and stuff that moves around"""
-import events
 from tile import Tile
+from session import Session
 
 import functools
 import itertools
 
 class Entity():
-    """A dynamic object on the map, such as a player or monster"""
+    """A dynamic object on the map, such as a player or monster
 
-    def __init__(self, tile, x, y, get_gameworld_cell):
+    Entities with a speed above 0 are actors: the map's TurnScheduler calls their take_turn
+    method whenever their turn comes up. Entities that nothing can walk into have
+    blocks_movement set, which the map's PassabilityGrid keeps track of.
+
+    session: The Session whose event bus this entity triggers events on. GameMap sets it
+        when the entity is put on a map; until then, events go to the current session.
+    """
+    speed = 0
+    blocks_movement = False
+
+    def __init__(self, tile, x, y, get_gameworld_cell, session=None):
         self.tile = tile
-        self.x = x
-        self.y = y
+        self.session = session
+        #The SpatialIndex of the map this entity is on, which needs to hear about moves
+        self.spatial_index = None
+        self._x = x
+        self._y = y
         self.get_gameworld_cell = get_gameworld_cell
 
         self.inventory = []
 
+    def __getstate__(self):
+        #get_gameworld_cell and session belong to a particular GameWorld; GameMap.attach
+        #sets them again
+        state = self.__dict__.copy()
+        state["get_gameworld_cell"] = None
+        state["session"] = None
+        return state
+
+    @property
+    def x(self):
+        return self._x
+
+    @x.setter
+    def x(self, value):
+        self.set_position(value, self._y)
+
+    @property
+    def y(self):
+        return self._y
+
+    @y.setter
+    def y(self, value):
+        self.set_position(self._x, value)
+
+    def set_position(self, x, y):
+        """Move this entity to x, y and let the map's spatial index know"""
+        old_x, old_y = self._x, self._y
+        self._x, self._y = x, y
+        if self.spatial_index is not None:
+            self.spatial_index.move(self, old_x, old_y)
+
+    def trigger_event(self, eventname, *args, **kwargs):
+        """Trigger an event on this entity's session's event bus"""
+        session = self.session if self.session is not None else Session.current()
+        session.event_bus.trigger(eventname, *args, **kwargs)
+
     def player_collision(self, player):
         """Called when the player attempts to enter the same cell as this entity
 
@@ -23,26 +72,43 @@ class Entity():
         """
         return True
 
+    def take_turn(self):
+        """Called by the scheduler when it's this entity's turn to act
+
+        Return the energy cost of the action taken (see scheduler.ACTION_COST), or None
+        to go to sleep until something calls wake.
+        """
+        return None
+
+    def wake(self):
+        """Ask for this entity to be scheduled again after it went to sleep"""
+        self.trigger_event("entity_wake", self)
+
     def die(self):
         """Remove this entity from the world"""
-        events.trigger_event("on_entity_death", self)
+        self.trigger_event("on_entity_death", self)
 
 class Player(Entity):
-    """A player character"""
+    """A player character
+
+    session: The Session whose events control this player. Defaults to the current one.
+    """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, session=None, **kwargs):
         tile = Tile('@', foreground="WHITE", background="CYAN")
-        super(Player, self).__init__(tile, *args, **kwargs)
+        session = session if session is not None else Session.current()
+        super(Player, self).__init__(tile, *args, session=session, **kwargs)
 
         #A flag that might temporarily be set to false during the move step if something
         #prevents the player from moving
         self.should_move = True 
 
-        events.listen_to_event("player_move", self.move)
-        events.listen_to_event("player_should_stop", self.cancel_move)
-        events.listen_to_event("player_display_inventory", self.display_inventory)
-        events.listen_to_event("player_drop_inventory", self.drop_inventory)
-        events.listen_to_event("player_use_portal", self.use_portal)
+        event_bus = self.session.event_bus
+        event_bus.listen("player_move", self.move)
+        event_bus.listen("player_should_stop", self.cancel_move)
+        event_bus.listen("player_display_inventory", self.display_inventory)
+        event_bus.listen("player_drop_inventory", self.drop_inventory)
+        event_bus.listen("player_use_portal", self.use_portal)
 
     def move(self, x_dir, y_dir):
         """Check the map and move the player in the given direction
@@ -50,22 +116,30 @@ class Player(Entity):
         x_dir, y_dir: Values between -1 and 1 specifying the direction the player
         will move along that axis.
         """
+        if self.spatial_index is None:
+            return #Not on any map, so there's nowhere to move to
         self.should_move = True
         next_coords = (self.x + x_dir, self.y + y_dir)
 
-        #First we directly inform the contents of the next cell that a player is trying
-        #to enter it - this way we can minimize the use of the event
-        next_cell_feature, next_cell_entities = self.get_gameworld_cell(*next_coords)
-        thingies = next_cell_entities + [next_cell_feature]
-        for thingy in thingies:
-            self.should_move = (thingy.player_collision(self) and self.should_move)
+        #Walls, the edge of the map and blocking entities are all in the passability grid,
+        #so the map feature only hears about the bump when the cell can't be entered
+        if not self.spatial_index.passability.is_passable(*next_coords):
+            next_cell_feature, _ = self.get_gameworld_cell(*next_coords)
+            next_cell_feature.player_collision(self)
+            self.should_move = False
+
+        #Then we directly inform the entities in the next cell that a player is trying
+        #to enter it, since bumping into one can do something, like reading a sign.
+        #This way we can minimize the use of the event
+        for entity in self.spatial_index.at(*next_coords):
+            self.should_move = (entity.player_collision(self) and self.should_move)
 
         #Then we trigger an event for anyone not in the next cell who might care
         #If they stop us from moving, they should trigger "player_should_stop"
-        events.trigger_event("player_enter_space", self, *next_coords)
+        self.trigger_event("player_enter_space", self, *next_coords)
 
         if self.should_move:
-            self.x, self.y = next_coords
+            self.set_position(*next_coords)
 
     def cancel_move(self):
         """Stop an in-progress movement
@@ -77,7 +151,7 @@ class Player(Entity):
     def receive_item(self, item):
         """Add item to the player's inventory"""
         self.inventory.append(item)
-        events.trigger_event("print_message", "Picked up {0}".format(item))
+        self.trigger_event("print_message", "Picked up {0}".format(item))
 
     def display_inventory(self):
         """Display a message listing the player's inventory"""
@@ -86,7 +160,7 @@ class Player(Entity):
         action_list = [(item, nothing_func) for item in self.inventory]
         if len(action_list) == 0:
             header += "Nothing at all"
-        events.trigger_event("print_list", action_list, header=header)
+        self.trigger_event("print_list", action_list, header=header)
         
     def drop_inventory(self):
         """Present list of inventory items and drop the one selected on
@@ -94,13 +168,13 @@ class Player(Entity):
         """
         header = "Choose item to drop:\n"
         def drop(get_gameworld_cell, x, y, item):
-            item_entity = ItemPickup([item], x, y, get_gameworld_cell)
-            events.trigger_event("world_add_entity", item_entity)
+            item_entity = ItemPickup([item], x, y, get_gameworld_cell, session=self.session)
+            self.trigger_event("world_add_entity", item_entity)
             self.inventory.remove(item)
         action_list = [(item, functools.partial(drop, get_gameworld_cell=self.get_gameworld_cell, x=self.x, y=self.y, item=item)) for item in self.inventory]
         if len(action_list) == 0:
                 header += "You hold nothing!"
-        events.trigger_event("print_list", action_list, header=header)
+        self.trigger_event("print_list", action_list, header=header)
 
     def use_portal(self):
         """Use a portal the player is standing on"""
@@ -139,9 +213,23 @@ class Signpost(Entity):
         super(Signpost, self).__init__(*args, **kwargs)
 
         self.message = message
-        self.let_player_through = False
+        self._let_player_through = False
+
+    @property
+    def let_player_through(self):
+        return self._let_player_through
+
+    @let_player_through.setter
+    def let_player_through(self, value):
+        self._let_player_through = value
+        if self.spatial_index is not None:
+            self.spatial_index.blocking_changed(self)
+
+    @property
+    def blocks_movement(self):
+        return not self._let_player_through
 
     def player_collision(self, player):
         """On player collision, display the message"""
-        events.trigger_event("print_message", self.message)
+        self.trigger_event("print_message", self.message)
         return self.let_player_through
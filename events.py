@@ -1,20 +1,207 @@
 """A module for event handling
 
 Objects register themselves to arbitrary string event names, which they pass callback functions to.
+
+Listening with a bound method only holds a weak reference to its object, so listening to
+an event never keeps an object alive: once nothing else refers to it, it quietly stops
+listening. Plain functions are held normally.
+
+Events can also be marked as deferrable. While the bus is in deferred mode, those events
+wait in a queue until the game loop flushes it, and redundant ones are merged or cancelled
+out along the way. Other events are always dispatched right away.
 """
-from collections import defaultdict
+import time
+import weakref
+import contextvars
+from collections import defaultdict, deque
+
+class _StrongRef():
+    """Looks like a weak reference, but keeps its callback alive"""
+    __slots__ = ("callback",)
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def __call__(self):
+        return self.callback
+
+class EventBus():
+    """A set of event names and the callbacks listening to them"""
+
+    def __init__(self):
+        #eventname -> list of references to callbacks
+        self._listeners = defaultdict(list)
+        #eventname -> tuple of the same references, rebuilt whenever the list changes, so
+        #that triggering an event doesn't copy anything and listeners can come and go
+        #while it runs
+        self._dispatch = {}
+
+        #When profiling is on, stats maps eventname -> [times triggered, total seconds
+        #spent in its callbacks (including any events they triggered)]
+        self.profiling = False
+        self.stats = defaultdict(lambda: [0, 0.0])
+
+        #When deferred is on, deferrable events are queued until flush is called
+        self.deferred = False
+        #eventname -> merge function, for deferrable events
+        self._deferrable = {}
+        #eventname -> set of deferrable events that it cancels out
+        self._cancellers = defaultdict(set)
+        #Queued [eventname, args, kwargs] entries, oldest first
+        self._queue = deque()
+
+    def listen(self, eventname, callback, weak=True):
+        """Register a callback to be called when eventname fires
+
+        If callback is a bound method and weak is True, the bus doesn't keep the method's
+        object alive.
+        """
+        if weak and hasattr(callback, "__self__") and hasattr(callback, "__func__"):
+            ref = weakref.WeakMethod(callback)
+        else:
+            ref = _StrongRef(callback)
+        self._listeners[eventname].append(ref)
+        self._dispatch.pop(eventname, None)
+
+    def unlisten(self, eventname, callback):
+        """Stop calling callback when eventname fires"""
+        self._listeners[eventname] = [ref for ref in self._listeners[eventname]
+                                      if ref() is not None and ref() != callback]
+        self._dispatch.pop(eventname, None)
+
+    def defer(self, eventname, merge=None, cancelled_by=()):
+        """Make eventname deferrable, so that it waits for flush while in deferred mode
+
+        merge: A function taking the positional args of a queued eventname and of a new one
+            triggered straight after it, and returning the args of a single event that
+            replaces both
+        cancelled_by: Names of events that, when triggered with the same arguments as a
+            queued eventname, cancel it: neither of the two is dispatched
+        """
+        self._deferrable[eventname] = merge
+        for canceller in cancelled_by:
+            self._cancellers[canceller].add(eventname)
+
+    def trigger(self, eventname, *args, **kwargs):
+        """Call all the registered callbacks that are listening to eventname, or queue the
+        event if it is deferrable and the bus is in deferred mode
+        """
+        if self.deferred:
+            if eventname in self._cancellers and self._cancel_queued(eventname, args, kwargs):
+                return
+            if eventname in self._deferrable:
+                self._enqueue(eventname, args, kwargs)
+                return
+        self._call_listeners(eventname, args, kwargs)
+
+    def flush(self):
+        """Dispatch every queued event in the order they were triggered, along with any
+        deferrable events that their listeners trigger in turn
+        """
+        while len(self._queue) > 0:
+            eventname, args, kwargs = self._queue.popleft()
+            self._call_listeners(eventname, args, kwargs)
+
+    def reset_stats(self):
+        """Clear the profiling counters"""
+        self.stats.clear()
 
-__event_listeners = defaultdict(list)
+    ## PRIVATE METHODS ##
+    def _call_listeners(self, eventname, args, kwargs):
+        refs = self._dispatch.get(eventname)
+        if refs is None:
+            refs = self._dispatch[eventname] = tuple(self._listeners[eventname])
 
-def listen_to_event(eventname, callback):
+        if self.profiling:
+            start = time.perf_counter()
+
+        found_dead = False
+        for ref in refs:
+            callback = ref()
+            if callback is None:
+                found_dead = True
+            else:
+                callback(*args, **kwargs)
+        if found_dead:
+            self._prune(eventname)
+
+        if self.profiling:
+            event_stats = self.stats[eventname]
+            event_stats[0] += 1
+            event_stats[1] += time.perf_counter() - start
+
+    def _enqueue(self, eventname, args, kwargs):
+        """Queue an event, merging it into the last queued one if they're the same kind"""
+        merge = self._deferrable[eventname]
+        if merge is not None and len(self._queue) > 0:
+            last_entry = self._queue[-1]
+            if last_entry[0] == eventname and not kwargs and not last_entry[2]:
+                last_entry[1] = tuple(merge(last_entry[1], args))
+                return
+        self._queue.append([eventname, args, kwargs])
+
+    def _cancel_queued(self, canceller, args, kwargs):
+        """Remove the most recent queued event that canceller cancels out, if there is
+        one with the same arguments, and return whether one was found
+        """
+        cancellable = self._cancellers[canceller]
+        for entry in reversed(self._queue):
+            if entry[0] in cancellable and entry[1] == args and entry[2] == kwargs:
+                self._queue.remove(entry)
+                return True
+        return False
+
+    def _prune(self, eventname):
+        """Drop listeners whose objects have been garbage collected"""
+        self._listeners[eventname] = [ref for ref in self._listeners[eventname] if ref() is not None]
+        self._dispatch.pop(eventname, None)
+
+__current_bus = contextvars.ContextVar("event_bus", default=EventBus())
+
+def get_event_bus():
+    """Return the EventBus that the functions in this module use in the current context.
+    Each Session has its own, and activating a session makes its bus current.
+    """
+    return __current_bus.get()
+
+def set_event_bus(bus):
+    """Make bus the current EventBus. Return a token for reset_event_bus."""
+    return __current_bus.set(bus)
+
+def reset_event_bus(token):
+    """Go back to the EventBus that was current before set_event_bus"""
+    __current_bus.reset(token)
+
+def listen_to_event(eventname, callback, weak=True):
     """Register an object to listen to an event
 
     eventname: A string identifying the event to listen for
     callback: A function to be called on listening_object when the event fires
+    weak: If callback is a bound method, whether to let its object be garbage collected
+        while it's still listening
     """
-    __event_listeners[eventname].append(callback)
+    get_event_bus().listen(eventname, callback, weak)
+
+def stop_listening_to_event(eventname, callback):
+    """Unregister a callback registered with listen_to_event"""
+    get_event_bus().unlisten(eventname, callback)
 
 def trigger_event(eventname, *args, **kwargs):
-    """Call all the registered callbacks that are listening to eventname"""
-    for callback in __event_listeners[eventname]:
-        callback(*args, **kwargs)
+    """Call all the registered callbacks that are listening to eventname (or queue the
+    event, if it's deferrable and deferred mode is on)
+    """
+    get_event_bus().trigger(eventname, *args, **kwargs)
+
+def defer_event(eventname, merge=None, cancelled_by=()):
+    """Make eventname deferrable; see EventBus.defer"""
+    get_event_bus().defer(eventname, merge, cancelled_by)
+
+def set_deferred(deferred):
+    """Turn deferred mode on or off. Turning it off dispatches anything still queued."""
+    get_event_bus().deferred = deferred
+    if not deferred:
+        get_event_bus().flush()
+
+def flush_events():
+    """Dispatch all queued deferrable events"""
+    get_event_bus().flush()
@@ -0,0 +1,142 @@
+"""A module for working out which cells can be seen from where
+
+FieldOfView runs recursive shadowcasting over an opacity bitmap: a bytearray with one
+byte per cell of the map, 1 where the cell blocks sight (see MapGrid.get_opacity). The
+cells visible from a position within a radius are cached, so standing still, or coming
+back to a spot, costs nothing. Changing a cell's opacity only throws away the cached
+results that could have seen that cell.
+
+See http://www.roguebasin.com/index.php/FOV_using_recursive_shadowcasting
+"""
+from collections import OrderedDict
+
+from bitset import get_row_masks
+
+#Transforms from octant-relative coordinates to map coordinates, one column per octant
+_OCTANTS = ((1, 0, 0, -1, -1, 0, 0, 1),
+            (0, 1, -1, 0, 0, -1, 1, 0),
+            (0, 1, 1, 0, 0, -1, -1, 0),
+            (1, 0, 0, 1, -1, 0, 0, -1))
+
+class VisibleCells(frozenset):
+    """The cells visible from somewhere, as y*width + x, along with the same cells as
+    {y: mask} row masks for OR-ing into a bitset.CellBitset. Bit 0 of each mask is column
+    mask_x, the leftmost visible column, so the masks stay small however wide the map is.
+    """
+    __slots__ = ("row_masks", "mask_x")
+
+    def __new__(cls, cells, width):
+        visible = super(VisibleCells, cls).__new__(cls, cells)
+        visible.mask_x = min((index % width for index in visible), default=0)
+        visible.row_masks = get_row_masks(visible, width, visible.mask_x)
+        return visible
+
+class FieldOfView():
+    """Computes and caches the visible cells of one map
+
+    opacity: A bytearray of width*height bytes, row by row, nonzero where a cell is opaque
+    cache_size: How many (position, radius) results to keep
+    """
+
+    def __init__(self, opacity, width, height, cache_size=64):
+        self.opacity = opacity
+        self.width = width
+        self.height = height
+        self.cache_size = cache_size
+        #(x, y, radius) -> VisibleCells, least recently used first
+        self._cache = OrderedDict()
+
+    def __getstate__(self):
+        #The cache is cheap to rebuild, so don't pickle it
+        state = self.__dict__.copy()
+        state["_cache"] = OrderedDict()
+        return state
+
+    def compute(self, x, y, radius):
+        """Return a VisibleCells of the cells visible from x, y within radius, as indexes
+        y*width + x. The same set is returned until something invalidates it, so callers
+        can tell whether anything changed by comparing identity.
+        """
+        key = (x, y, radius)
+        visible = self._cache.get(key)
+        if visible is not None:
+            self._cache.move_to_end(key)
+            return visible
+
+        found = set()
+        if 0 <= x < self.width and 0 <= y < self.height:
+            found.add(y*self.width + x)
+            for octant in range(8):
+                self._cast_light(x, y, 1, 1.0, 0.0, radius,
+                                 _OCTANTS[0][octant], _OCTANTS[1][octant],
+                                 _OCTANTS[2][octant], _OCTANTS[3][octant], found)
+        visible = VisibleCells(found, self.width)
+
+        self._cache[key] = visible
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return visible
+
+    def is_opaque(self, x, y):
+        """Return whether the cell at x, y blocks sight. Everything off the map does."""
+        return not (0 <= x < self.width and 0 <= y < self.height) or self.opacity[y*self.width + x] != 0
+
+    def set_opaque(self, x, y, opaque):
+        """Change whether the cell at x, y blocks sight, forgetting any cached results
+        that it could have changed
+        """
+        index = y*self.width + x
+        if bool(self.opacity[index]) == bool(opaque):
+            return
+        self.opacity[index] = 1 if opaque else 0
+        for key in [key for key in self._cache
+                    if max(abs(key[0] - x), abs(key[1] - y)) <= key[2]]:
+            del self._cache[key]
+
+    ## PRIVATE METHODS ##
+    def _cast_light(self, c_x, c_y, row, start, end, radius, xx, xy, yx, yy, found):
+        """Scan one octant outward from row, between the slopes start and end, adding
+        visible cells to found and recursing past anything that casts a shadow
+        """
+        if start < end:
+            return
+        width = self.width
+        height = self.height
+        opacity = self.opacity
+        radius_squared = radius*radius
+        new_start = start
+        for distance in range(row, radius+1):
+            d_x = -distance - 1
+            d_y = -distance
+            blocked = False
+            while d_x <= 0:
+                d_x += 1
+                #The slopes of this cell's left and right edges
+                left_slope = (d_x - 0.5) / (d_y + 0.5)
+                right_slope = (d_x + 0.5) / (d_y - 0.5)
+                if start < right_slope:
+                    continue
+                if end > left_slope:
+                    break
+
+                m_x = c_x + d_x*xx + d_y*xy
+                m_y = c_y + d_x*yx + d_y*yy
+                on_map = 0 <= m_x < width and 0 <= m_y < height
+                if on_map and d_x*d_x + d_y*d_y < radius_squared:
+                    found.add(m_y*width + m_x)
+                opaque = not on_map or opacity[m_y*width + m_x] != 0
+
+                if blocked:
+                    if opaque:
+                        new_start = right_slope
+                    else:
+                        blocked = False
+                        start = new_start
+                elif opaque and distance < radius:
+                    #This cell starts a shadow; scan what's visible past its near side
+                    blocked = True
+                    self._cast_light(c_x, c_y, distance+1, start, left_slope, radius,
+                                     xx, xy, yx, yy, found)
+                    new_start = right_slope
+            if blocked:
+                break
@@ -0,0 +1,105 @@
+"""A module for timing the phases of each frame of the game loop
+
+The game loop calls FrameTimer.mark after each phase of a frame, naming the phase that
+just ended, and FrameTimer.end_frame once the frame is over. The timer keeps a rolling
+window of recent frames to report percentiles from, such as in the debug overlay, and
+optionally every frame, to write out as a trace when the game ends.
+"""
+import csv
+import json
+import time
+from collections import deque
+
+#The phases of a frame, in the order they happen
+PHASES = ("panels", "get_view", "draw", "input_wait", "keys", "events", "world")
+
+def percentile(sorted_values, fraction):
+    """Return the nearest-rank percentile of an already sorted list"""
+    if len(sorted_values) == 0:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+class FrameTimer():
+    """Times each phase of every frame
+
+    window: How many recent frames to report percentiles over
+    keep_trace: Whether to keep every frame's timings for write_trace
+    """
+
+    def __init__(self, window=120, keep_trace=False):
+        self._phase_index = {phase: idx for idx, phase in enumerate(PHASES)}
+        #Each frame is a list of seconds spent in each phase, in PHASES order
+        self._current = [0.0] * len(PHASES)
+        self._last_mark = time.perf_counter()
+        self.recent = deque(maxlen=window)
+        self.trace = [] if keep_trace else None
+
+    def mark(self, phase):
+        """Add the time since the previous mark to phase. A phase can be marked more than
+        once a frame, and the times add up.
+        """
+        now = time.perf_counter()
+        self._current[self._phase_index[phase]] += now - self._last_mark
+        self._last_mark = now
+
+    def end_frame(self):
+        """Store the current frame's timings and start a new frame"""
+        frame = self._current
+        self.recent.append(frame)
+        if self.trace is not None:
+            self.trace.append(frame)
+        self._current = [0.0] * len(PHASES)
+
+    def get_summary(self, frames=None):
+        """Return {phase: (p50, p95, p99)} in seconds, for each phase and for the whole
+        frame ("total"), over frames (the recent window by default)
+        """
+        frames = self.recent if frames is None else frames
+        columns = list(zip(*frames)) if len(frames) > 0 else [()] * len(PHASES)
+        columns.append(tuple(sum(frame) for frame in frames))
+        summary = {}
+        for phase, column in zip(PHASES + ("total",), columns):
+            values = sorted(column)
+            summary[phase] = (percentile(values, 0.50), percentile(values, 0.95), percentile(values, 0.99))
+        return summary
+
+    def get_overlay_lines(self):
+        """Return the recent percentiles as lines of text for the debug overlay, in milliseconds"""
+        lines = ["{0:<10} {1:>7} {2:>7} {3:>7}".format("ms/frame", "p50", "p95", "p99")]
+        for phase, (p50, p95, p99) in self.get_summary().items():
+            lines.append("{0:<10} {1:>7.2f} {2:>7.2f} {3:>7.2f}".format(phase, p50*1000, p95*1000, p99*1000))
+        return lines
+
+    def write_trace(self, path):
+        """Write every frame's timings to path: as CSV if it ends in .csv, otherwise as JSON
+        with percentiles over the whole game alongside the frames
+        """
+        if self.trace is None:
+            raise ValueError("This FrameTimer wasn't created with keep_trace=True")
+        if path.endswith(".csv"):
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(("frame",) + PHASES + ("total",))
+                for idx, frame in enumerate(self.trace):
+                    writer.writerow([idx] + frame + [sum(frame)])
+        else:
+            with open(path, 'w') as f:
+                json.dump({"phases": PHASES,
+                           "summary": {phase: dict(zip(("p50", "p95", "p99"), values))
+                                       for phase, values in self.get_summary(self.trace).items()},
+                           "frames": self.trace}, f)
+
+class NullFrameTimer():
+    """Has the same methods as FrameTimer, but doesn't time anything, for when nobody is
+    going to look at the timings
+    """
+
+    def mark(self, phase):
+        pass
+
+    def end_frame(self):
+        pass
+
+    def get_overlay_lines(self):
+        return []
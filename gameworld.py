@@ -1,30 +1,113 @@
+import random
+
 import entities
 import mapfeatures
 import keyinput
-import events
 import mapgenfuncs
+from tile import Tile
+from mapgrid import MapGrid
+from fov import FieldOfView
+from bitset import unpack_row
+from pathfinding import Pathfinder
+from passability import PassabilityGrid
+from spatialindex import SpatialIndex
+from scheduler import TurnScheduler, ACTION_COST
+from prefetch import LevelPrefetcher
+from levelcache import LevelCache, derive_seed, generate_level
+from levelstore import LevelStore
+from session import Session
+
+class _RememberedTiles(dict):
+    """Maps each tile to how it looks when it's remembered rather than in sight"""
+
+    def __missing__(self, tile):
+        remembered = self[tile] = Tile(tile.char, foreground="BLUE", background=tile.background)
+        return remembered
 
 class GameWorld():
     """A class to hold the current state of the game world"""
 
-    def __init__(self, *args, **kwargs):
-        #self._mapfeatures is a 2d list that holds things like floors and walls
+    #How many levels below the current one to generate in the background
+    prefetch_levels = 0
+    #How many levels besides the current one to keep in memory, or None to keep them all.
+    #The rest are compressed to disk until the player goes back to them.
+    resident_levels = None
+    #How far the player can see, or None to see the whole map at all times
+    fov_radius = None
+    _remembered_tiles = _RememberedTiles()
+
+    def __init__(self, *args, seed=None, level_cache_dir=None, session=None, fov_radius=None,
+                 level_store_dir=None, **kwargs):
+        #self._grid is a MapGrid that holds things like floors and walls
         #self._entities is a list of dynamic objects, which store their own coordinates
+        #self._entity_index is a SpatialIndex of those same entities, for lookups by position
+        #self._scheduler is a TurnScheduler that decides when those entities get to act
+
+        #The Session this game belongs to; its event bus is the one the world listens on
+        self.session = session if session is not None else Session.current()
+
+        #Each generated level is seeded from this, so a given seed always builds the same levels
+        self.seed = seed if seed is not None else random.randrange(2**32)
+        #Generated levels are saved here and loaded instead of regenerated, if it's set
+        self.level_cache = LevelCache(level_cache_dir) if level_cache_dir is not None else None
+        self.prefetcher = LevelPrefetcher() if self.prefetch_levels > 0 else None
+        if fov_radius is not None:
+            self.fov_radius = fov_radius
+        #The fov.VisibleCells (cells as y*width + x) the player can see, or None if field of
+        #view is off and everything can be seen
+        self._visible = None
 
         self.current_map_idx = 0
-        self.maplist = [GameMap(self, *args, **kwargs)]
-        self._player = entities.Player(*self.maplist[self.current_map_idx].player_spawn, self.get)
+        first_rng = random.Random(self.get_level_seed(self.current_map_idx))
+        #Levels by depth; levels left long enough ago are evicted to level_store_dir, or a
+        #temporary directory, and come back when they're asked for
+        self.maplist = LevelStore(self, resident_levels=self.resident_levels, directory=level_store_dir)
+        self.maplist.append(self.create_first_map(first_rng, *args, **kwargs))
+        self._player = entities.Player(*self.maplist[self.current_map_idx].player_spawn, self.get,
+                                       session=self.session)
         self.load_map(self.maplist[self.current_map_idx])
 
-        events.listen_to_event("on_entity_death", lambda e: self._entities.remove(e))
-        events.listen_to_event("world_remove_entity", lambda e: self._entities.remove(e))
-        events.listen_to_event("world_add_entity", lambda e: self._entities.append(e))
-        events.listen_to_event("change_map", self.change_map)
-        events.listen_to_event("change_map_down", self.change_map_down)
-        events.listen_to_event("change_map_up", self.change_map_up)
+        #In deferred mode, an entity that is added and removed again within one turn is
+        #never added at all
+        event_bus = self.session.event_bus
+        event_bus.defer("world_add_entity", cancelled_by=("world_remove_entity", "on_entity_death"))
+        event_bus.defer("world_remove_entity")
+        event_bus.defer("on_entity_death")
+        event_bus.listen("on_entity_death", self.remove_entity)
+        event_bus.listen("world_remove_entity", self.remove_entity)
+        event_bus.listen("world_add_entity", self.add_entity)
+        event_bus.listen("entity_wake", self.wake_entity)
+        event_bus.listen("change_map", self.change_map)
+        event_bus.listen("change_map_down", self.change_map_down)
+        event_bus.listen("change_map_up", self.change_map_up)
+
+    def get_view(self, view_width=None, view_height=None, origin=(None, None), center_on_player=False,
+                 with_entities=True):
+        """Returns a 2d matrix of the top tiles of a subset of the board
+
+        with_entities: If False, only map features are included
+        """
+        o_x, o_y, view_width, view_height = self.get_view_rect(view_width, view_height, origin, center_on_player)
+
+        #Flatten map
+        #Add map feature tiles
+        flattened = self._grid.get_tile_rows(o_x, o_y, view_width, view_height)
+        visible = self._visible
+        if visible is not None:
+            self._apply_fov(flattened, o_x, o_y, view_width, view_height)
+        #add entity tiles
+        if with_entities:
+            for entity in self._entity_index.in_rect(o_x, o_y, view_width, view_height):
+                if visible is None or entity.y*self.width + entity.x in visible:
+                    e_x = entity.x - o_x
+                    e_y = entity.y - o_y
+                    flattened[e_y][e_x] = entity.tile
+        return flattened
 
-    def get_view(self, view_width=None, view_height=None, origin=(None, None), center_on_player=False):
-        """Returns a 2d matrix of the top tiles of a subset of the board"""
+    def get_view_rect(self, view_width=None, view_height=None, origin=(None, None), center_on_player=False):
+        """Return the x, y, width and height of the part of the map that get_view would
+        show with the same arguments
+        """
         #Set defaults
         if view_width is None:
             view_width = self.width
@@ -39,40 +122,132 @@ class GameWorld():
         #Constrain view to map size
         view_width = min(view_width, self.width)
         view_height = min(view_height, self.height)
-        o_x = min(o_x, self.width-1)
-        o_y = min(o_y, self.height-1)
+        o_x = max(0, min(o_x, self.width-1))
+        o_y = max(0, min(o_y, self.height-1))
 
         #center on player
         if center_on_player:
             o_x = min(max(self._player.x - view_width//2, 0), self.width - view_width)
             o_y = min(max(self._player.y - view_height//2, 0), self.height - view_height)
+        else:
+            #Cut the view off at the edge of the map, as the rows of a list of lists would be
+            view_width = min(view_width, self.width - o_x)
+            view_height = min(view_height, self.height - o_y)
+        return o_x, o_y, view_width, view_height
 
-        #Flatten map
-        max_x = o_x + view_width
-        max_y = o_y + view_height
-        flattened = [['' for x in range(view_width)] for y in range(view_height)]
-        #Add map feature tiles
-        for y, row in enumerate(self._mapfeatures[o_y:max_y]):
-            for x, cell in enumerate(row[o_x:max_x]):
-                flattened[y][x] = cell.tile if cell is not None else mapfeatures.Void().tile
-        #add entity tiles
-        for entity in self._entities:
-            if o_x <= entity.x < max_x and o_y <= entity.y < max_y:
-                e_x = entity.x - o_x
-                e_y = entity.y - o_y
-                flattened[e_y][e_x] = entity.tile
-        return flattened
+    def get_cell_tile(self, x, y):
+        """Return the tile get_view shows for the map feature at x, y: as it is if it's in
+        sight, dimmed if it's only remembered, and blank if it's never been seen
+        """
+        tile = self._grid.get(x, y).tile
+        if self._visible is None:
+            return tile
+        index = y*self.width + x
+        if index in self._visible:
+            return tile
+        if (x, y) in self._seen:
+            return self._remembered_tiles[tile]
+        return self._grid.tiles[0]
+
+    def get_visible_cells(self):
+        """Return the fov.VisibleCells the player can see, as y*width + x, or None if
+        field of view is off. The same set comes back until what's visible changes.
+        """
+        return self._visible
+
+    def is_visible(self, x, y):
+        """Return whether the player can see the cell at x, y"""
+        return self._visible is None or y*self.width + x in self._visible
+
+    def update_fov(self):
+        """Work out what the player can see now, and remember having seen it"""
+        if self.fov_radius is None:
+            self._visible = None
+            return
+        visible = self._fov.compute(self._player.x, self._player.y, self.fov_radius)
+        if visible is not self._visible:
+            self._seen.update_rows(visible.row_masks, visible.mask_x)
+            self._visible = visible
+
+    def is_passable(self, x, y):
+        """Return whether something can walk onto x, y on the current map: its map feature
+        is passable and no entity there blocks movement. Nothing is asked, so nothing
+        happens, unlike when the player bumps into things.
+        """
+        return self._passability.is_passable(x, y)
+
+    def find_path(self, start, goal, diagonal=True):
+        """Return a shortest list of (x, y) steps from start to goal on the current map,
+        not including start, or None if there's no way there
+        """
+        return self._pathfinder.find_path(start, goal, diagonal)
+
+    def get_distance_map(self, targets, diagonal=True):
+        """Return a pathfinding.DistanceMap to targets, a list of (x, y) cells, on the
+        current map. Every monster chasing the player this turn gets the same one:
+        gameworld.get_distance_map([(player.x, player.y)]).next_step(monster.x, monster.y)
+        """
+        return self._pathfinder.get_distance_map(targets, diagonal)
 
     def get(self, x, y):
         """Returns the contents of the cell at x, y as a (mapfeatures, entities) tuple"""
         if (x < 0 or x > self.width-1) or (y < 0 or y > self.height-1):
             return (mapfeatures.Void(), [])
-        cell_entities = list(filter(lambda e: e.x == x and e.y == y, self._entities))
-        return (self._mapfeatures[y][x], cell_entities)
+        cell_entities = self._entity_index.at(x, y)
+        return (self._grid.get(x, y), cell_entities)
+
+    def get_entities_in_rect(self, x, y, width, height):
+        """Return a list of the entities on the current map within the width x height
+        rectangle whose upper left corner is at x, y
+        """
+        return self._entity_index.in_rect(x, y, width, height)
+
+    def set_mapfeature(self, x, y, mapfeature):
+        """Replace the map feature at x, y, for things like doors opening"""
+        self._grid.set(x, y, mapfeature)
+        self._fov.set_opaque(x, y, mapfeature.opaque)
+        self._pathfinder.set_passable(x, y, mapfeature.passable)
+        self._passability.set_feature(x, y, mapfeature)
+        self.update_fov()
+        self.session.event_bus.trigger("map_feature_changed", x, y)
+
+    def add_entity(self, entity):
+        """Put an entity on the current map"""
+        self.maplist[self.current_map_idx].add_entity(entity)
+
+    def remove_entity(self, entity):
+        """Take an entity off whichever map it's on, if it's on one"""
+        gamemap = self.get_map_of(entity)
+        if gamemap is not None:
+            gamemap.remove_entity(entity)
+
+    def wake_entity(self, entity):
+        """Start scheduling a sleeping entity again on whichever map it's on"""
+        gamemap = self.get_map_of(entity)
+        if gamemap is not None:
+            gamemap.scheduler.wake(entity)
+
+    def get_map_of(self, entity):
+        """Return the GameMap in memory that entity is on, or None if it isn't on one
+        (for example, if it was already removed)
+        """
+        if entity.spatial_index is None:
+            return None
+        current_map = self.maplist[self.current_map_idx]
+        if entity.spatial_index is current_map.entity_index:
+            return current_map
+        for gamemap in self.maplist.get_resident_levels():
+            if entity.spatial_index is gamemap.entity_index:
+                return gamemap
+        return None
 
     def update_world(self):
-        """Generate the results of a single turn"""
-        pass
+        """Generate the results of a single turn: let everything else on the map act for
+        as long as the player's action took
+        """
+        self._scheduler.advance(ACTION_COST)
+        self.maplist[self.current_map_idx].on_turn(self._player)
+        self.update_fov()
 
     def change_map_down(self):
         """Set the current map to the next map down. Generate
@@ -83,17 +258,21 @@ class GameWorld():
     def change_map_up(self):
         """Set the current map to the next map up, if we're not at the surface.  """
         if self.current_map_idx > 0:
-            self.change_map(self.current_map_idx + 1)
+            self.change_map(self.current_map_idx - 1)
 
     def change_map(self, depth, *args, **kwargs):
         """Unload the current map and load a new one"""
         #Unload
         self.maplist[self.current_map_idx].on_unload()
-        self.maplist[self.current_map_idx]._entities.remove(self._player)
+        self.remove_entity(self._player)
 
-        #Generate new maps if necessary
+        #Generate new maps if necessary, picking up any that were prefetched
         while depth >= len(self.maplist):
-            new_map = self.create_new_map()
+            new_depth = len(self.maplist)
+            new_map = self.prefetcher.take(new_depth) if self.prefetcher is not None else None
+            if new_map is None:
+                new_map = self.create_new_map(new_depth)
+            new_map.attach(self)
             self.maplist.append(new_map)
 
         #Switch to the new map
@@ -106,26 +285,122 @@ class GameWorld():
         new_map.on_load()
 
         self._entities = new_map._entities
-        self._entities.append(self._player)
-        self._player.x = new_map.player_spawn[0]
-        self._player.y = new_map.player_spawn[1]
+        self._entity_index = new_map.entity_index
+        self._passability = new_map.passability
+        self._scheduler = new_map.scheduler
+        self._player.set_position(*new_map.player_spawn)
+        self.add_entity(self._player)
+
+        self._grid = new_map.grid
+        self.width = self._grid.width
+        self.height = self._grid.height
+        self._fov = new_map.fov
+        self._pathfinder = new_map.pathfinder
+        self._seen = new_map.seen
+        self._visible = None
+        self.update_fov()
+
+        self.session.event_bus.trigger("map_loaded", new_map)
+        self.prefetch_maps()
+
+    def prefetch_maps(self):
+        """Start generating the next few levels below the current one in the background"""
+        if self.prefetcher is None:
+            return
+        for depth in range(self.current_map_idx + 1, self.current_map_idx + 1 + self.prefetch_levels):
+            if depth >= len(self.maplist):
+                map_class, kwargs = self.get_map_factory(depth)
+                self.prefetcher.request(depth, map_class, self.get_level_seed(depth), kwargs, self.level_cache)
 
-        self._mapfeatures = new_map._mapfeatures
-        self.width = len(self._mapfeatures[0])
-        self.height = len(self._mapfeatures)
+    def get_level_seed(self, depth):
+        """Return the seed used to generate the level at depth"""
+        return derive_seed(self.seed, depth)
 
-    def create_new_map(self):
-        """Return a new GameMap"""
-        return GameMap(self, mapgenfuncs.empty_box, width=self.width, height=self.height)
+    def get_map_factory(self, depth):
+        """Return a (map_class, kwargs) pair such that map_class(gameworld, rng=rng, **kwargs)
+        builds the level at depth. Both have to be picklable so that levels can be prefetched
+        and cached.
+        """
+        return GameMap, {"genfunc": mapgenfuncs.empty_box, "width": self.width, "height": self.height}
+
+    def close(self):
+        """Stop any work going on in the background. Call this once the game is over."""
+        if self.prefetcher is not None:
+            self.prefetcher.shutdown()
+
+    def get_level_summary(self):
+        """Return one line about which levels are in memory and how restoring them has gone"""
+        return self.maplist.get_summary()
+
+    def create_first_map(self, rng, *args, **kwargs):
+        """Build the map the game starts on, from the arguments the GameWorld was given.
+        A generated one goes through the level cache like any other level; one read from a
+        map file doesn't, since the cache couldn't tell when the file changes.
+        """
+        from_file = kwargs.get("genfunc") is mapgenfuncs.load_from_file
+        if self.level_cache is not None and len(args) == 0 and not from_file:
+            first_map = generate_level(GameMap, self.get_level_seed(0), 0, kwargs, self.level_cache)
+            first_map.attach(self)
+            return first_map
+        return GameMap(self, *args, rng=rng, **kwargs)
+
+    def create_new_map(self, depth):
+        """Generate (or load from the level cache) and return the unattached GameMap for depth"""
+        map_class, kwargs = self.get_map_factory(depth)
+        return generate_level(map_class, self.get_level_seed(depth), depth, kwargs, self.level_cache)
+
+    ## PRIVATE METHODS ##
+    def _apply_fov(self, rows, o_x, o_y, view_width, view_height):
+        """Blank out the cells of rows (from get_tile_rows at o_x, o_y) that the player has
+        never seen, and dim the ones that are only remembered
+        """
+        seen = self._seen
+        visible_masks = self._visible.row_masks
+        #How far to shift the visible masks right to line them up with the view
+        shift = o_x - self._visible.mask_x
+        view_mask = (1 << view_width) - 1
+        blank = self._grid.tiles[0]
+        remembered = self._remembered_tiles
+        for row_idx, row in enumerate(rows):
+            row_seen = seen.get_row(o_y + row_idx, o_x, view_width)
+            visible_mask = visible_masks.get(o_y + row_idx, 0)
+            visible_mask = (visible_mask >> shift if shift >= 0 else visible_mask << -shift) & view_mask
+            if visible_mask != 0:
+                row_visible = unpack_row(visible_mask, view_width)
+                rows[row_idx] = [tile if is_visible else remembered[tile] if was_seen else blank
+                                 for tile, was_seen, is_visible in zip(row, row_seen, row_visible)]
+            elif any(row_seen):
+                rows[row_idx] = [remembered[tile] if was_seen else blank
+                                 for tile, was_seen in zip(row, row_seen)]
+            else:
+                rows[row_idx] = [blank] * view_width
 
 
 class GameMap():
     """A class for a single map, a collection of which makes up a gameworld.
     Subclasses should implement generate or else pass a genfunc to the constructor.
     """
+
+    #Whether the map can be pickled to disk while the player is elsewhere (see levelstore)
+    evictable = True
+
     def __init__(self, gameworld, genfunc, *args, **kwargs):
         self.gameworld = gameworld
-        self._mapfeatures, self._entities, self.player_spawn = genfunc(gameworld, *args, **kwargs)
+        mapfeatures_matrix, self._entities, self.player_spawn = genfunc(gameworld, *args, **kwargs)
+        if isinstance(mapfeatures_matrix, list):
+            self.grid = MapGrid(mapfeatures_matrix)
+        else:
+            #A ready-made MapGrid, or something that acts like one (see chunkedmap)
+            self.grid = mapfeatures_matrix
+        self.passability = PassabilityGrid(self.grid)
+        self.entity_index = SpatialIndex(self._entities, passability=self.passability)
+        self.scheduler = TurnScheduler(self._entities)
+        self.fov = FieldOfView(self.grid.get_opacity(), self.grid.width, self.grid.height)
+        #Which cells the player has seen
+        self.seen = self.grid.new_bitset()
+        self.pathfinder = Pathfinder(self.grid.get_passability(), self.grid.width, self.grid.height)
+        if gameworld is not None:
+            self.attach(gameworld)
 
     #A reasonable pattern for subclasses is to implement this:
     #
@@ -137,10 +412,44 @@ class GameMap():
     #
     #super(YourGameMapSubclass, self).__init__(gameworld=gameworld, genfunc=self.generate, etc...)
 
+    def __getstate__(self):
+        #The GameWorld stays behind when a map is pickled; attach hooks it up again
+        state = self.__dict__.copy()
+        state["gameworld"] = None
+        return state
+
+    def attach(self, gameworld):
+        """Hook up a map that was generated without a GameWorld, such as one built in
+        another process
+        """
+        self.gameworld = gameworld
+        for entity in self._entities:
+            entity.get_gameworld_cell = gameworld.get
+            entity.session = gameworld.session
+
+    def add_entity(self, entity):
+        """Put an entity on this map, whether or not it's the current one"""
+        if self.gameworld is not None:
+            entity.get_gameworld_cell = self.gameworld.get
+            entity.session = self.gameworld.session
+        self._entities.append(entity)
+        self.entity_index.add(entity)
+        self.scheduler.add(entity)
+
+    def remove_entity(self, entity):
+        """Take an entity off this map, whether or not it's the current one"""
+        self._entities.remove(entity)
+        self.entity_index.remove(entity)
+        self.scheduler.remove(entity)
+
     def on_load(self):
         """Called when this map becomes the current map"""
         pass
 
+    def on_turn(self, player):
+        """Called at the end of every turn while this is the current map"""
+        pass
+
     def on_unload(self):
         """Called when the player leaves the map"""
         pass
@@ -0,0 +1,57 @@
+"""Overworld: An open-ended stretch of wilderness, streamed in chunks around the player."""
+import mapgenfuncs
+from gameworld import GameWorld, GameMap
+from chunkedmap import ChunkedMapGrid
+
+class OverworldGameWorld(GameWorld):
+    """A GameWorld whose first map is an OverworldGameMap
+
+    chunk_dir: Where to store chunks the player has left behind, or None for a temporary
+        directory
+    """
+
+    fov_radius = 12
+
+    def __init__(self, *args, chunk_dir=None, **kwargs):
+        self.chunk_dir = chunk_dir
+        super(OverworldGameWorld, self).__init__(*args, **kwargs)
+
+    def create_first_map(self, rng, *args, **kwargs):
+        return OverworldGameMap(self, *args, seed=self.get_level_seed(0), chunk_dir=self.chunk_dir, **kwargs)
+
+    def find_path(self, start, goal, diagonal=True):
+        #A* could wander off through any number of chunks, generating each one it reaches
+        raise NotImplementedError("Pathfinding isn't supported on the overworld, which has "
+                                  "{0}x{1} cells".format(self.width, self.height))
+
+    def get_distance_map(self, targets, diagonal=True):
+        #A DistanceMap holds 4 bytes for every cell of the map, gigabytes of them here
+        raise NotImplementedError("Distance maps aren't supported on the overworld, which has "
+                                  "{0}x{1} cells".format(self.width, self.height))
+
+class OverworldGameMap(GameMap):
+    """A map of width_chunks x height_chunks chunks of chunk_size cells, of which only the
+    chunks within load_radius of the player's are kept in memory
+    """
+
+    #The chunked grid keeps its own chunks on disk, and can't be pickled whole
+    evictable = False
+
+    def __init__(self, gameworld, width_chunks=1024, height_chunks=1024, chunk_size=64,
+                 load_radius=1, seed=0, chunk_dir=None, *args, **kwargs):
+        self.chunked_grid = ChunkedMapGrid(mapgenfuncs.overworld_chunk, width_chunks, height_chunks,
+                                           chunk_size=chunk_size, seed=seed, load_radius=load_radius,
+                                           directory=chunk_dir)
+        super(OverworldGameMap, self).__init__(gameworld=gameworld, genfunc=self.generate, *args, **kwargs)
+        self.chunked_grid.attach_map(self)
+
+    def generate(self, gameworld):
+        #Start in the middle of the world, on whatever grass is nearest
+        grid = self.chunked_grid
+        spawn_x, spawn_y = grid.width // 2, grid.height // 2
+        while not grid.get(spawn_x, spawn_y).passable:
+            spawn_x += 1
+        return grid, [], (spawn_x, spawn_y)
+
+    def on_turn(self, player):
+        self.chunked_grid.update_residency(player.x, player.y)
@@ -9,32 +9,35 @@ from gameworld import GameWorld, GameMap
 
 class QuarryDepthsGameWorld(GameWorld):
 
+    prefetch_levels = 1
+    resident_levels = 3
+    fov_radius = 10
+
     def __init__(self, *args, **kwargs):
         super(QuarryDepthsGameWorld, self).__init__(*args, **kwargs)
 
-    def create_new_map(self):
-        return QuarryDepthsGameMap(self)
+    def get_map_factory(self, depth):
+        return QuarryDepthsGameMap, {"width": 75, "height": 50}
 
 class QuarryDepthsGameMap(GameMap):
 
-    def __init__(self, gameworld, *args, **kwargs):
-        self.width = 75
-        self.height = 50
+    def __init__(self, gameworld, width=75, height=50, *args, **kwargs):
+        self.width = width
+        self.height = height
         super(QuarryDepthsGameMap, self).__init__(gameworld=gameworld, genfunc=self.generate, *args, **kwargs)
 
-    def generate(self, *args, **kwargs):
-        mapfeatures = [[]]
-        entities = []
+    def generate(self, gameworld, rng=random):
+        canvas = mapcomponents.MapCanvas(self.width, self.height)
         player_spawn = (0,0)
 
         #First, build rooms and corridors.
-        #Then, copy the rooms and corridors into mapfeatures and entities.
-        roomlist = mapgenfuncs.bsp(mapcomponents.Room, self.width, self.height)
+        #Then, stamp the rooms and corridors onto the canvas.
+        roomlist = mapgenfuncs.bsp(mapcomponents.Room, self.width, self.height, rng=rng,
+                                   corridorclass=mapcomponents.Corridor)
         for room in roomlist:
-            mapfeatures = mapgenfuncs.union_mapfeatures(mapfeatures, room.mapfeatures, room.w_x, room.w_y)
-            entities.extend(room.entities)
+            canvas.stamp(room, transparent=True)
     
-        return mapfeatures, entities, player_spawn
+        return canvas.mapfeatures, canvas.entities, player_spawn
 
 
 
@@ -46,12 +49,13 @@ def test_print(stdscr):
     debugoutput.init(stdscr)
     gw = QuarryDepthsGameWorld(genfunc=mapgenfuncs.load_from_file, mapfile=open("maps/testmap.map"))
     window_height, window_width = stdscr.getmaxyx()
+    tile_colors = gw.session.color_registry.tile_colors
     while True:
         view = gw.get_view(view_width=window_width, view_height=window_height)
         stdscr.clear()
         for y, row in enumerate(view):
             for x, tile in enumerate(row):
-                stdscr.addstr(y, x, tile.char, tile.color)
+                stdscr.addstr(y, x, tile.char, tile_colors[tile])
         debugoutput.flush_debug_text()
         stdscr.refresh()
         key = stdscr.getkey()
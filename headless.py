@@ -0,0 +1,155 @@
+"""A module for running the game without a terminal
+
+HeadlessWindow stands in for a curses window. It implements the subset of the window
+methods that the renderer, the screen panels and debugoutput use, and writes into
+in-memory buffers instead of a screen. Keys come from an iterable, and running out of
+keys looks to the game like the user pressing Ctrl-C.
+
+HeadlessColorRegistry hands out color attributes the same way tile.ColorRegistry does,
+without curses.init_pair, which only works once curses has taken over a terminal.
+"""
+import curses
+
+from tile import ColorRegistry, parse_color_name
+
+class HeadlessWindow():
+    """An in-memory curses window
+
+    height, width: The size of the window
+    keys: An iterable of key names (as curses' getkey returns them) to hand out from getkey
+    """
+
+    def __init__(self, height, width, keys=()):
+        self._height = height
+        self._width = width
+        self._top = 0
+        self._left = 0
+        #The buffers are shared with any sub-windows: rows of characters, and rows of the
+        #attributes they were written with
+        self.chars = [[' '] * width for y in range(height)]
+        self.attrs = [[0] * width for y in range(height)]
+        self._keys = iter(keys)
+        #The number of times the window (or any of its sub-windows) was refreshed
+        self.frames = [0]
+
+    def subwin(self, height, width, y, x):
+        """Return a window sharing this one's buffers, with its top left corner at y, x
+        in screen coordinates
+        """
+        window = HeadlessWindow.__new__(HeadlessWindow)
+        window._height = min(height, self._top + self._height - y)
+        window._width = min(width, self._left + self._width - x)
+        window._top = y
+        window._left = x
+        window.chars = self.chars
+        window.attrs = self.attrs
+        window._keys = self._keys
+        window.frames = self.frames
+        return window
+
+    def getmaxyx(self):
+        return (self._height, self._width)
+
+    def getbegyx(self):
+        return (self._top, self._left)
+
+    def addstr(self, y, x, string, attr=0):
+        """Write string at y, x. Unlike curses, text running off the window is clipped
+        instead of raising an error.
+        """
+        if not (0 <= y < self._height and 0 <= x < self._width):
+            return
+        string = string[:self._width - x]
+        row_y = self._top + y
+        start = self._left + x
+        self.chars[row_y][start:start+len(string)] = string
+        self.attrs[row_y][start:start+len(string)] = [attr] * len(string)
+
+    def erase(self):
+        for y in range(self._top, self._top + self._height):
+            self.chars[y][self._left:self._left+self._width] = [' '] * self._width
+            self.attrs[y][self._left:self._left+self._width] = [0] * self._width
+
+    clear = erase
+
+    def border(self):
+        right = self._width - 1
+        bottom = self._height - 1
+        for x in range(1, right):
+            self.addstr(0, x, '-')
+            self.addstr(bottom, x, '-')
+        for y in range(1, bottom):
+            self.addstr(y, 0, '|')
+            self.addstr(y, right, '|')
+        for y, x in ((0, 0), (0, right), (bottom, 0), (bottom, right)):
+            self.addstr(y, x, '+')
+
+    def refresh(self):
+        self.frames[0] += 1
+
+    def noutrefresh(self):
+        #Everything is written straight to the screen buffers, so there's nothing to stage
+        pass
+
+    def doupdate(self):
+        """Stands in for curses.doupdate"""
+        self.frames[0] += 1
+
+    def newpad(self, height, width):
+        """Stands in for curses.newpad: return a HeadlessPad that copies onto this
+        window's screen
+        """
+        return HeadlessPad(height, width, self)
+
+    def getkey(self):
+        """Return the next key, or raise KeyboardInterrupt once there are no keys left"""
+        try:
+            return next(self._keys)
+        except StopIteration:
+            raise KeyboardInterrupt
+
+    def get_lines(self):
+        """Return the contents of the window as a list of strings"""
+        return ["".join(self.chars[y][self._left:self._left+self._width])
+                for y in range(self._top, self._top + self._height)]
+
+class HeadlessColorRegistry(ColorRegistry):
+    """Numbers color pairs like ColorRegistry, but never touches curses' color tables"""
+
+    def get_color(self, foreground, background, bold):
+        key = (parse_color_name(foreground), parse_color_name(background))
+        c_id = self._registered_colors.get(key)
+        if c_id is None:
+            self._max_color += 1
+            c_id = self._registered_colors[key] = self._max_color
+        #This is how curses.color_pair packs a pair number into an attribute
+        color_pair = c_id << 8
+        if bold:
+            color_pair |= curses.A_BOLD
+        return color_pair
+
+class HeadlessPad(HeadlessWindow):
+    """An in-memory curses pad: a window with buffers of its own, any part of which can
+    be copied onto the screen
+
+    screen: The HeadlessWindow (or any of its sub-windows) whose buffers are the screen
+    """
+
+    def __init__(self, height, width, screen):
+        super(HeadlessPad, self).__init__(height, width)
+        self._screen = screen
+
+    def noutrefresh(self, pminrow, pmincol, sminrow, smincol, smaxrow, smaxcol):
+        """Copy the pad, starting from pminrow, pmincol, onto the screen rectangle from
+        sminrow, smincol to smaxrow, smaxcol inclusive
+        """
+        width = smaxcol - smincol + 1
+        for row in range(smaxrow - sminrow + 1):
+            pad_row = pminrow + row
+            screen_row = sminrow + row
+            self._screen.chars[screen_row][smincol:smincol+width] = self.chars[pad_row][pmincol:pmincol+width]
+            self._screen.attrs[screen_row][smincol:smincol+width] = self.attrs[pad_row][pmincol:pmincol+width]
+
+    def refresh(self, *args):
+        self.noutrefresh(*args)
+        self._screen.doupdate()
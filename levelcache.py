@@ -0,0 +1,82 @@
+"""A module for building levels from a seed and caching them on disk
+
+A level built by a given generator from a given seed always comes out the same, so once
+it has been built it can be pickled to disk and loaded the next time anyone asks for it,
+whether that's a player revisiting a world or a benchmark run.
+"""
+import os
+import pickle
+import random
+import hashlib
+import tempfile
+
+import mapgenfuncs
+
+def derive_seed(world_seed, depth):
+    """Return the seed for the level at depth in a world with world_seed. The result is
+    the same on every platform and Python version, so it can be used in cache keys.
+    """
+    digest = hashlib.sha256("{0}:{1}".format(world_seed, depth).encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+def generate_level(map_class, seed, depth, kwargs, cache=None):
+    """Return a GameMap that isn't attached to any GameWorld yet, loading it from cache if
+    it's there and generating (and caching) it if not.
+
+    map_class(gameworld, rng=..., **kwargs) should build the level. This can run in a
+    worker process, so map_class, kwargs and cache must be picklable.
+    """
+    if cache is not None:
+        cached_map = cache.load(map_class, seed, depth, kwargs)
+        if cached_map is not None:
+            return cached_map
+    new_map = map_class(None, rng=random.Random(seed), **kwargs)
+    if cache is not None:
+        cache.store(new_map, map_class, seed, depth, kwargs)
+    return new_map
+
+class LevelCache():
+    """A directory of pickled levels keyed by (generator version, generator, seed, depth,
+    size and other generator arguments)
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def load(self, map_class, seed, depth, kwargs):
+        """Return the cached GameMap for these parameters, or None if there isn't one"""
+        path = self._get_path(map_class, seed, depth, kwargs)
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except Exception:
+            #A stale or damaged entry is no worse than a missing one
+            return None
+
+    def store(self, gamemap, map_class, seed, depth, kwargs):
+        """Write gamemap to the cache"""
+        path = self._get_path(map_class, seed, depth, kwargs)
+        #Write to a temporary file and move it into place, so a reader (maybe another
+        #process) never sees half a level
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(gamemap, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    ## PRIVATE METHODS ##
+    def _get_path(self, map_class, seed, depth, kwargs):
+        key = repr((mapgenfuncs.GENERATOR_VERSION,
+                    _get_name(map_class),
+                    seed,
+                    depth,
+                    sorted((k, _get_name(v) if callable(v) else v) for k, v in kwargs.items())))
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ".level")
+
+def _get_name(obj):
+    """Return a name for a class or function that is the same from one run to the next"""
+    return "{0}.{1}".format(obj.__module__, obj.__qualname__)
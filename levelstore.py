@@ -0,0 +1,130 @@
+"""A module for keeping only the levels in play in memory
+
+A LevelStore stands in for the list of a GameWorld's levels. It keeps the current level
+and a few of the most recently used others in memory, and pickles the rest, compressed,
+to disk: their features, entities, and which cells the player has explored. Asking for a
+level that was put away brings it back, so the GameWorld never has to know it was gone.
+"""
+import os
+import time
+import zlib
+import pickle
+import tempfile
+from collections import OrderedDict
+
+from frametimer import percentile
+
+class LevelStore():
+    """A GameWorld's levels, indexed by depth like a list
+
+    gameworld: The GameWorld to attach levels to when they come back from disk
+    resident_levels: How many levels besides the current one to keep in memory, or None
+        to keep every level
+    directory: Where to put levels that are evicted, or None for a temporary directory
+        that is deleted along with the store
+    """
+
+    def __init__(self, gameworld, resident_levels=None, directory=None, compression_level=6):
+        self.gameworld = gameworld
+        self.resident_levels = resident_levels
+        self.compression_level = compression_level
+        if directory is None:
+            self._temp_dir = tempfile.TemporaryDirectory(prefix="rockslike-levels-")
+            directory = self._temp_dir.name
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+        #depth -> GameMap, or None while the level is on disk
+        self._levels = []
+        #Depths of the levels in memory, least recently used first
+        self._recent = OrderedDict()
+        #depth -> compressed size of the level on disk
+        self._stored_sizes = {}
+        #Depths that have been played on, so going back to them counts as a hit or a miss
+        self._visited = set()
+        self._last_depth = None
+
+        #Going back to a level that was still in memory, or had to be read back from disk
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        #Seconds taken to bring back each level read from disk
+        self.restore_times = []
+
+    def __len__(self):
+        return len(self._levels)
+
+    def append(self, gamemap):
+        """Add the level below the deepest one so far"""
+        self._levels.append(gamemap)
+        self._touch(len(self._levels) - 1)
+
+    def __getitem__(self, depth):
+        gamemap = self._levels[depth]
+        if depth != self._last_depth:
+            if gamemap is None:
+                gamemap = self._restore(depth)
+                self.misses += 1
+            elif depth in self._visited:
+                self.hits += 1
+            self._visited.add(depth)
+            self._last_depth = depth
+            self._touch(depth)
+        return gamemap
+
+    def get_resident_levels(self):
+        """Return the GameMaps in memory, without touching any of them"""
+        return [self._levels[depth] for depth in self._recent]
+
+    def is_resident(self, depth):
+        """Return whether the level at depth is in memory"""
+        return self._levels[depth] is not None
+
+    def get_summary(self):
+        """Return one line about what's in memory and on disk, and how restoring has gone"""
+        restore_times = sorted(self.restore_times)
+        return "levels: {0} in memory, {1} on disk ({2:.0f}KB); {3} hits, {4} misses; restore p50 {5:.1f}ms max {6:.1f}ms".format(
+            len(self._recent), len(self._stored_sizes), sum(self._stored_sizes.values()) / 1024,
+            self.hits, self.misses, percentile(restore_times, 0.50) * 1000,
+            restore_times[-1] * 1000 if len(restore_times) > 0 else 0.0)
+
+    ## PRIVATE METHODS ##
+    def _touch(self, depth):
+        """Mark the level at depth as the most recently used, and evict the least recently
+        used levels that no longer fit
+        """
+        self._recent[depth] = None
+        self._recent.move_to_end(depth)
+        if self.resident_levels is None:
+            return
+        excess = len(self._recent) - (self.resident_levels + 1)
+        for old_depth in list(self._recent)[:-1]:
+            if excess <= 0:
+                break
+            if self._levels[old_depth].evictable:
+                self._evict(old_depth)
+                excess -= 1
+
+    def _evict(self, depth):
+        data = zlib.compress(pickle.dumps(self._levels[depth], pickle.HIGHEST_PROTOCOL), self.compression_level)
+        with open(self._get_path(depth), "wb") as f:
+            f.write(data)
+        self._stored_sizes[depth] = len(data)
+        self._levels[depth] = None
+        del self._recent[depth]
+        self.evictions += 1
+
+    def _restore(self, depth):
+        start = time.perf_counter()
+        path = self._get_path(depth)
+        with open(path, "rb") as f:
+            gamemap = pickle.loads(zlib.decompress(f.read()))
+        gamemap.attach(self.gameworld)
+        self.restore_times.append(time.perf_counter() - start)
+        os.remove(path)
+        del self._stored_sizes[depth]
+        self._levels[depth] = gamemap
+        return gamemap
+
+    def _get_path(self, depth):
+        return os.path.join(self.directory, "{0}.level.z".format(depth))
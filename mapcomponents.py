@@ -2,6 +2,7 @@
 import random
 
 import mapfeatures
+import mapgenfuncs
 
 class MapComponent():
 
@@ -74,17 +75,50 @@ class MapComponent():
 
         return new_component
 
+class MapCanvas():
+    """A fixed-size grid that map components are stamped into in place
+
+    This is the cheap way to compose a whole map out of rooms and corridors: unlike
+    union_mapfeatures, stamping a component never reallocates or copies the grid.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+        self.mapfeatures = [[None for x in range(self.width)] for y in range(self.height)]
+        self.entities = []
+
+    def stamp(self, component, transparent=False):
+        """Copy a MapComponent's tiles and entities onto the canvas at the component's
+        world coordinates. Tiles from the component overwrite tiles already on the canvas
+        (unless transparent is True, in which case its empty tiles don't), and the
+        component's entities are moved into world space.
+        """
+        self.stamp_mapfeatures(component.mapfeatures, component.w_x, component.w_y, transparent)
+        for e in component.entities:
+            e.x += component.w_x
+            e.y += component.w_y
+        self.entities.extend(component.entities)
+
+    def stamp_mapfeatures(self, mapfeatures_matrix, x_offset, y_offset, transparent=False):
+        """Copy a 2d list of mapfeatures onto the canvas, offset x_offset tiles to the right
+        and y_offset tiles down
+        """
+        mapgenfuncs.blit_mapfeatures(self.mapfeatures, mapfeatures_matrix, x_offset, y_offset, transparent)
+
 class Room(MapComponent):
     """A randomly-sized box of floor tiles surrounded with wall tiles.
     world_coordinates - a tuple containing the x,y coordintates of the room's upperleft-most tile
         in world-space.
     width_range - a tuple containing the min and max+1 possible width values
     height_range - a tuple containing the min and max+1 possible height values
+    rng - the source of randomness: a random.Random, or the random module itself
     """
 
-    def __init__(self, world_coordinates, width_range, height_range, *args, **kwargs):
-        self.width = random.randrange(*width_range)
-        self.height = random.randrange(*height_range)
+    def __init__(self, world_coordinates, width_range, height_range, *args, rng=random, **kwargs):
+        self.width = rng.randrange(*width_range)
+        self.height = rng.randrange(*height_range)
         super(Room, self).__init__(world_coordinates, self.width, self.height, *args, **kwargs)
 
         self.mapfeatures = self.generate_room_mapfeatures()
@@ -107,8 +141,13 @@ class Room(MapComponent):
     def generate_room_entities(self):
         return []
 
+    def get_random_floor_coords(self, rng=random):
+        """Return the world coordinates of a random floor tile inside the room's walls"""
+        return (rng.randrange(self.w_x+1, self.w_x+self.width-1),
+                rng.randrange(self.w_y+1, self.w_y+self.height))
+
 class Corridor(MapComponent):
-    """A hallway of floor tiles.
+    """A hallway of floor tiles, one tile wide, with nothing on either side of it.
     start_coords - a tuple of x,y coordinates denoting one end of the corridor
     end_coords - a tuple of x,y coordinates denoting the other end of the corridor
     start_vertical - If True, the corridor will try to move upward or downward before
@@ -116,55 +155,55 @@ class Corridor(MapComponent):
         in whichever direction is farther between the two points.
     If start_coords and end_coords are not colinear, the corridor will bend in a Z or N shape
     at a random point along its length.
+    rng - the source of randomness: a random.Random, or the random module itself
     """
 
-    def __init__(self, start_coords, end_coords, start_vertical=None):
-        width = abs(start_coords[0] - end_coords[0])
-        height = abs(start_coords[1] - end_coords[1])
+    def __init__(self, start_coords, end_coords, start_vertical=None, rng=random):
+        width = abs(start_coords[0] - end_coords[0]) + 1
+        height = abs(start_coords[1] - end_coords[1]) + 1
         world_coords = (min(start_coords[0], end_coords[0]), min(start_coords[1], end_coords[1]))
         super(Corridor, self).__init__(world_coords, width, height)
 
         self.start_coords = start_coords
         self.end_coords = end_coords
+        self.rng = rng
 
         self.mapfeatures = self.generate_corridor_mapfeatures(start_vertical)
         self.entities = self.generate_corridor_entities()
 
     def generate_corridor_mapfeatures(self, start_vertical):
-        #Handle cases where endpoints are colinear
-        if self.start_coords[0] == self.end_coords[0]:
-            return [[mapfeatures.Floor() for tile in range(width)]]
-        if self.start_coords[1] == self.end_coords[1]:
-            return [[mapfeatures.Floor()] for row in range(height)]
-
-        #Otherwise, figure out where to bend
         if start_vertical is None:
             start_vertical = self.height > self.width
 
-        mapfeatures = [[None for tile in self.width] for row in range(self.height)]
+        #Work in the corridor's own coordinates, with 0,0 at its upper left
+        start_x, start_y = self.start_coords[0] - self.w_x, self.start_coords[1] - self.w_y
+        end_x, end_y = self.end_coords[0] - self.w_x, self.end_coords[1] - self.w_y
+        corridor = [[None for x in range(self.width)] for y in range(self.height)]
+        floor = mapfeatures.Floor()
+
+        #Run from the start to the bend, across, then from the bend to the end.
+        #Colinear endpoints just give a straight run.
         if start_vertical:
-            bend_point = random.randrange(1, self.height-1)
+            bend = self.rng.randrange(min(start_y, end_y), max(start_y, end_y) + 1)
+            for y in _span(start_y, bend):
+                corridor[y][start_x] = floor
+            for x in _span(start_x, end_x):
+                corridor[bend][x] = floor
+            for y in _span(bend, end_y):
+                corridor[y][end_x] = floor
         else:
-            bend_point = random.randrange(1, self.width-1)
-
-        left_point, right_point = (self.start_point, self.end_point) if self.start_point[0] < self.end_point[0] \
-                else (self.end_point, self.start_point)
-        top_point, bottom_point = (self.start_point, self.end_point) if self.start_point[1] < self.end_point[1] \
-                else (self.end_point, self.start_point)
-
-        for y, row in enumerate(self.height):
-            for x, tile in enumerate(self.width):
-                if start_vertical and \
-                        (x == self.top_point[0] and y < bend_point or \
-                         x == self.bottom_point[0] and y > bend_point or \
-                         y == bend_point) \
-                    or not start_vertical and \
-                        (y == self.left_point[1] and x < bend_point or \
-                         y == self.right_point[1] and x > bend_point or \
-                         x == bend_point):
-                            mapfeatures[y][x] = mapfeatures.Floor()
-        return mapfeatures
-
-    
+            bend = self.rng.randrange(min(start_x, end_x), max(start_x, end_x) + 1)
+            for x in _span(start_x, bend):
+                corridor[start_y][x] = floor
+            for y in _span(start_y, end_y):
+                corridor[y][bend] = floor
+            for x in _span(bend, end_x):
+                corridor[end_y][x] = floor
+        return corridor
+
     def generate_corridor_entities(self):
         return []
+
+def _span(a, b):
+    """Every coordinate from a to b inclusive, whichever is bigger"""
+    return range(min(a, b), max(a, b) + 1)
@@ -1,15 +1,56 @@
 """This module holds dungeon features and generally immobile stuff"""
-import events
+import functools
+
 from tile import Tile
 
 class MapFeature():
-    """A static element of the map, such as a floor or wall tile"""
+    """A static element of the map, such as a floor or wall tile
+
+    Subclasses that set flyweight to True have no state beyond their tile, so constructing
+    one twice with the same arguments returns the same shared instance. Subclasses that
+    carry state of their own, like stairs with a destination, get a fresh instance each time.
+
+    Subclasses that block line of sight set opaque to True, and ones that nothing can
+    walk onto set passable to False.
+    """
+    __slots__ = ("tile",)
+    flyweight = False
+    opaque = False
+    passable = True
+    _flyweights = {}
+    #id(flyweight) -> the (args, kwargs) it was constructed with
+    _flyweight_args = {}
+
+    def __new__(cls, *args, **kwargs):
+        if not cls.flyweight:
+            return super(MapFeature, cls).__new__(cls)
+        try:
+            key = (cls, args, tuple(sorted(kwargs.items())))
+            feature = MapFeature._flyweights.get(key)
+        except TypeError:
+            #Unhashable arguments; don't bother sharing this one
+            return super(MapFeature, cls).__new__(cls)
+        if feature is None:
+            feature = super(MapFeature, cls).__new__(cls)
+            MapFeature._flyweights[key] = feature
+            MapFeature._flyweight_args[id(feature)] = (args, kwargs)
+        return feature
+
+    def __reduce_ex__(self, protocol):
+        #Flyweights unpickle by calling the constructor again, so they stay shared
+        if self.flyweight and id(self) in MapFeature._flyweight_args:
+            args, kwargs = MapFeature._flyweight_args[id(self)]
+            return (functools.partial(self.__class__, **kwargs), args)
+        return super(MapFeature, self).__reduce_ex__(protocol)
 
     def __init__(self, tilechar='?', fgcolor="BLACK", bgcolor="RED", bold=False):
+        if hasattr(self, "tile"):
+            return #A shared flyweight that has already been set up
         self.tile = Tile(tilechar, fgcolor, bgcolor, bold)
 
     def player_collision(self, player):
-        """Called when the player attempts to enter the same cell as this entity
+        """Called when the player attempts to enter the cell this feature is in, if the
+        passability grid says the cell can't be entered (see Player.move)
 
         Return whether the player should complete the move or not.
         """
@@ -17,12 +58,18 @@ class MapFeature():
 
 class Floor(MapFeature):
     """A tile the player can walk on"""
+    __slots__ = ()
+    flyweight = True
 
     def __init__(self, tilechar='.', fgcolor="WHITE", bgcolor="BLACK", *args, **kwargs):
         super(Floor, self).__init__(tilechar, fgcolor, bgcolor, *args, **kwargs)
 
 class Wall(MapFeature):
     """A tile that blocks the player's movement"""
+    __slots__ = ()
+    flyweight = True
+    opaque = True
+    passable = False
 
     def __init__(self, tilechar='#', fgcolor="WHITE", bgcolor="BLACK", *args, **kwargs):
         super(Wall, self).__init__(tilechar, fgcolor, bgcolor, *args, **kwargs)
@@ -32,6 +79,10 @@ class Wall(MapFeature):
 
 class Void(MapFeature):
     """The un-tile. Represents the boundaries of the world map"""
+    __slots__ = ()
+    flyweight = True
+    opaque = True
+    passable = False
 
     def __init__(self, tilechar=' ', fgcolor="BLACK", bgcolor="BLACK", *args, **kwargs):
         super(Void, self).__init__(tilechar, fgcolor, bgcolor, *args, **kwargs)
@@ -41,6 +92,8 @@ class Void(MapFeature):
 
 class StairsDown(MapFeature):
     """A tile from which the player can travel to the level below the current one"""
+    __slots__ = ("dest_coords",)
+
     def __init__(self, dest_coords=None,
                 tilechar='>', fgcolor="WHITE", bgcolor="BLACK", bold=True, *args, **kwargs):
         super(StairsDown, self).__init__(tilechar, fgcolor, bgcolor, bold, *args, **kwargs)
@@ -48,20 +101,22 @@ class StairsDown(MapFeature):
     
     def activate_portal(self, target_entity):
         """Change the map and move target_entity (probably the player) to the next map"""
-        events.trigger_event("change_map_down")
+        target_entity.trigger_event("change_map_down")
         if self.dest_coords is not None:
             target_entity.x, target_entity.y = dest_coords
 
 class StairsUp(MapFeature):
     """A tile from which the player can travel to the level above the current one"""
+    __slots__ = ("dest_coords",)
+
     def __init__(self, dest_coords=None,
                 tilechar='<', fgcolor="WHITE", bgcolor="BLACK", bold=True, *args, **kwargs):
-        super(StairsDown, self).__init__(tilechar, fgcolor, bgcolor, bold, *args, **kwargs)
+        super(StairsUp, self).__init__(tilechar, fgcolor, bgcolor, bold, *args, **kwargs)
         self.dest_coords = dest_coords
     
     def activate_portal(self, target_entity):
         """Change the map and move target_entity (probably the player) to the next map"""
-        events.trigger_event("change_map_up")
+        target_entity.trigger_event("change_map_up")
         if self.dest_coords is not None:
             target_entity.x, target_entity.y = dest_coords
 
@@ -1,25 +1,47 @@
 import random
 
 import parsemap
+import compiledmap
 import entities
 import mapfeatures
 
+#Bump this whenever a change to map generation means the same seed builds a different
+#level, or GameMaps hold different things, so that levels cached by an older version
+#aren't loaded
+GENERATOR_VERSION = 5
+
 ### MAP GENERATION FUNCTIONS ###
 #Take a gameworld object plus other args, return mapfeatures, entities, and player_spawn,
-#where "mapfeatures" is a 2d list of map features,
+#where "mapfeatures" is a 2d list of map features (or a ready-made MapGrid),
 #"entities" is a list of Entity subclass objects,
 #and "player_spawn" is a set of x, y coordinates for the player's spawn location, presented
 #as a tuple.
+#They also take an "rng" keyword argument: a random.Random (or the random module itself)
+#that all of their randomness must come from, so that a seed always builds the same map.
 
-def load_from_file(gw, mapfile):
-    """Parse mapfile and turn it into gameworld information"""
-    world, entities_partials, player_spawn = parsemap.parse_file(mapfile)
+def load_from_file(gw, mapfile, rng=random):
+    """Parse mapfile and turn it into gameworld information. If a compiled copy of the map
+    that is newer than mapfile sits next to it (see compiledmap), load that instead, unless
+    it turns out to be damaged.
+    """
+    source_path = getattr(mapfile, "name", None)
+    compiled = None
+    if isinstance(source_path, str) and compiledmap.is_up_to_date(source_path):
+        try:
+            compiled = compiledmap.load(compiledmap.get_compiled_path(source_path))
+        except (OSError, ValueError):
+            #The source map is still there to fall back on
+            pass
+    if compiled is not None:
+        world, entities_partials, player_spawn = compiled
+    else:
+        world, entities_partials, player_spawn = parsemap.parse_file(mapfile)
     map_entities = [partial(get_gameworld_cell=gw.get) for partial in entities_partials]
     # player = list(filter(lambda x: isinstance(x, entities.Player), map_entities))[0]
     # player_spawn = (player.x, player.y)
     return world, map_entities, player_spawn
 
-def empty_box(gw, width, height):
+def empty_box(gw, width, height, rng=random):
     """Generate a big, empty box of floor with walls around it and put the player in the middle"""
     world = [[mapfeatures.Wall() for x in range(width)]]
     floor_row = [mapfeatures.Wall()]
@@ -56,7 +78,34 @@ def union_mapfeatures(a, b, x_offset, y_offset):
         new_mapfeatures.append(row)
     return new_mapfeatures
 
-def bsp(roomclass, width, height, p_w_x=0, p_w_y=0, iteration=0):
+def blit_mapfeatures(dest, src, x_offset, y_offset, transparent=False):
+    """Copy the 2d list of mapfeatures src into the 2d list dest in place, with src offset
+    by x_offset to the right and y_offset downward. Cells from src overwrite cells in dest,
+    just as they do in union_mapfeatures, unless transparent is True, in which case empty
+    (None) cells in src leave dest alone. Parts of src that fall outside dest are clipped.
+    """
+    dest_height = len(dest)
+    dest_width = len(dest[0]) if dest_height > 0 else 0
+    src_height = len(src)
+    src_width = len(src[0]) if src_height > 0 else 0
+    #The range of src's columns and rows that land inside dest
+    left = max(0, -x_offset)
+    right = min(src_width, dest_width - x_offset)
+    top = max(0, -y_offset)
+    bottom = min(src_height, dest_height - y_offset)
+    if left >= right:
+        return
+    for src_y in range(top, bottom):
+        dest_row = dest[src_y + y_offset]
+        src_row = src[src_y]
+        if transparent:
+            for src_x in range(left, right):
+                if src_row[src_x] is not None:
+                    dest_row[src_x + x_offset] = src_row[src_x]
+        else:
+            dest_row[left+x_offset:right+x_offset] = src_row[left:right]
+
+def bsp(roomclass, width, height, p_w_x=0, p_w_y=0, iteration=0, rng=random, corridorclass=None):
     """Recursively divide a space into halves. When the halves are small enough, generate
     rooms in them, then link the rooms with their neighbor partitions' rooms until all the 
     partitions are linked. bsp = Binary Space Partition
@@ -67,6 +116,9 @@ def bsp(roomclass, width, height, p_w_x=0, p_w_y=0, iteration=0):
     p_w_x: The partition's x coordinate in world-space (the entire game map)
     p_w_y: The partition's y coordinate in world-space
     iteration: The depth of the recursive function
+    rng: The source of randomness, passed on to roomclass
+    corridorclass: The Corridor class to link each pair of halves with, or None to leave
+        the rooms unconnected
     """
     # debugoutput.add_debug_string("BSP iteration: {0}".format(iteration))
     max_iterations = 10
@@ -79,43 +131,76 @@ def bsp(roomclass, width, height, p_w_x=0, p_w_y=0, iteration=0):
 
     #0. Check if we're too small or randomly stop based on depth, and if so, build the room and return it.
     if width <= partition_width_threshold or height <= partition_height_threshold or \
-            random.random() < iteration/max_iterations:
-        room_p_x = random.randrange(0, width-min_room_width)
-        room_p_y = random.randrange(0, height-min_room_height)
+            rng.random() < iteration/max_iterations:
+        room_p_x = rng.randrange(0, width-min_room_width)
+        room_p_y = rng.randrange(0, height-min_room_height)
         max_room_width = width-room_p_x
         max_room_height = height-room_p_y
         room_w_x = p_w_x + room_p_x
         room_w_y = p_w_y + room_p_y
-        return [roomclass((room_w_x, room_w_y), (min_room_width, max_room_width), (min_room_height, max_room_height))]
+        return [roomclass((room_w_x, room_w_y), (min_room_width, max_room_width), (min_room_height, max_room_height), rng=rng)]
 
     #1. Divide the area in half randomly.
     v_split = iteration % 2 == 0
     splitbounds = (width_margin, width-width_margin) if v_split else (height_margin, height-height_margin)
-    split = random.randrange(*splitbounds)
+    split = rng.randrange(*splitbounds)
 
     #2. Call bsp on the two halves, collect their roomlists.
     width1 = split if v_split else width
     height1 = split if not v_split else height
     p_w_x1 = p_w_x
     p_w_y1 = p_w_y
-    roomlist1 = bsp(roomclass, width1, height1, p_w_x1, p_w_y1, iteration+1)
+    roomlist1 = bsp(roomclass, width1, height1, p_w_x1, p_w_y1, iteration+1, rng, corridorclass)
 
     width2 = width-split if v_split else width
     height2 = height-split if not v_split else height
     p_w_x2 = p_w_x+split if v_split else p_w_x
     p_w_y2 = p_w_y+split if not v_split else p_w_y
-    roomlist2 = bsp(roomclass, width2, height2, p_w_x2, p_w_y2, iteration+1)
+    roomlist2 = bsp(roomclass, width2, height2, p_w_x2, p_w_y2, iteration+1, rng, corridorclass)
 
     #3. Pick a point in each roomlist and connect them with a corridor.
-
-    #A "corridor" is a room with width or length 0
-    #I need to pick 4 points: 2 endpoints, 2 bend points. These points will specify the z-corridor.
-    #Endpoints: Pick a random point along the parallel axis, then find where it intersects a room or corridor along
-    #   the perpendicular axis,
-    #Bendpoints: Pick a random place for the bend, just like picking a split.
-    #Also check for intersection.
-    #TODO: Implement this
+    #Each half's room nearest the middle of the split makes for the shortest corridor.
+    #The corridor comes after both halves in the list, so stamping it (transparently)
+    #cuts doorways through their walls rather than being walled over.
+    if corridorclass is None:
+        return roomlist1 + roomlist2
+    split_x = p_w_x + split if v_split else p_w_x + width//2
+    split_y = p_w_y + split if not v_split else p_w_y + height//2
+    def distance_to_split(room):
+        return abs(room.w_x + room.width//2 - split_x) + abs(room.w_y + room.height//2 - split_y)
+    room1 = min((room for room in roomlist1 if isinstance(room, roomclass)), key=distance_to_split)
+    room2 = min((room for room in roomlist2 if isinstance(room, roomclass)), key=distance_to_split)
+    corridor = corridorclass(room1.get_random_floor_coords(rng), room2.get_random_floor_coords(rng),
+                             start_vertical=not v_split, rng=rng)
 
     #4. Return all rooms and corridors.
-    return roomlist1 + roomlist2
-    # return (roomlist1 + roomlist2).append(corridor)
+    return roomlist1 + roomlist2 + [corridor]
+
+### CHUNK GENERATION FUNCTIONS ###
+#Build one chunk of a chunkedmap.ChunkedMapGrid. Take the chunk's position (in chunks) and
+#size, plus an "rng" keyword argument, and return a size x size 2d list of map features and
+#a list of entities placed in map coordinates. Entities get their get_gameworld_cell when
+#the chunk is put on a map.
+
+def overworld_chunk(chunk_x, chunk_y, size, rng=random):
+    """A stretch of open grass, with stands of trees to walk around and the odd thing
+    lying in the grass
+    """
+    grass = mapfeatures.Floor('.', "GREEN")
+    tree = mapfeatures.Wall('T', "GREEN")
+    world = [[grass for x in range(size)] for y in range(size)]
+    for stand in range(rng.randrange(2, 6)):
+        center_x, center_y = rng.randrange(size), rng.randrange(size)
+        radius = rng.randrange(2, 7)
+        for y in range(max(0, center_y - radius), min(size, center_y + radius + 1)):
+            for x in range(max(0, center_x - radius), min(size, center_x + radius + 1)):
+                if (x - center_x)**2 + (y - center_y)**2 <= radius**2 and rng.random() < 0.6:
+                    world[y][x] = tree
+
+    map_entities = []
+    for find in range(rng.randrange(0, 3)):
+        x, y = rng.randrange(size), rng.randrange(size)
+        if world[y][x] is grass:
+            map_entities.append(entities.ItemPickup([rng.choice(("a pinecone", "a feather", "a shiny pebble"))],
+                                                    chunk_x*size + x, chunk_y*size + y, None))
+    return world, map_entities
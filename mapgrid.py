@@ -0,0 +1,114 @@
+"""A module for compact storage of a map's features
+
+Rather than keeping a 2d list with a MapFeature object in every cell, a MapGrid keeps
+a flat array of small integer ids plus a table mapping each id to a feature. Stateless
+features are shared flyweights (see mapfeatures.MapFeature), so every cell showing the
+same kind of floor shares a single table entry.
+"""
+from array import array
+
+import mapfeatures
+from bitset import CellBitset
+
+#Array typecodes for the id grid: 16 bits per cell until there are too many distinct
+#features to number that way
+_SMALL_IDS = 'H'
+_LARGE_IDS = 'I'
+_MAX_SMALL_ID = 0xFFFF
+
+class MapGrid():
+    """A width x height grid of map features stored as an array of feature ids"""
+
+    def __init__(self, mapfeatures_matrix):
+        """mapfeatures_matrix: A 2d list of MapFeatures, as returned by a map generation
+        function. Empty (None) cells and the missing ends of short rows become Void.
+        """
+        self.height = len(mapfeatures_matrix)
+        self.width = max((len(row) for row in mapfeatures_matrix), default=0)
+
+        #Id 0 is always Void, so that empty cells need no lookup
+        self.features = [mapfeatures.Void()]
+        self.tiles = [self.features[0].tile]
+        #id(feature) -> feature id
+        self._feature_ids = {id(self.features[0]): 0}
+
+        self._ids = array(_SMALL_IDS)
+        for row in mapfeatures_matrix:
+            row_ids = [0 if feature is None else self._intern(feature) for feature in row]
+            row_ids.extend([0] * (self.width - len(row_ids)))
+            self._ids.extend(row_ids)
+
+    @classmethod
+    def from_ids(cls, width, height, features, ids):
+        """Build a MapGrid directly from a feature table and an array of ids into it, such
+        as a compiled map provides. features[0] should be Void.
+        """
+        grid = cls.__new__(cls)
+        grid.width = width
+        grid.height = height
+        grid.features = list(features)
+        grid.tiles = [feature.tile for feature in grid.features]
+        grid._feature_ids = {id(feature): feature_id for feature_id, feature in enumerate(grid.features)}
+        grid._ids = ids
+        return grid
+
+    def get(self, x, y):
+        """Return the MapFeature at x, y"""
+        return self.features[self._ids[y*self.width + x]]
+
+    def set(self, x, y, feature):
+        """Replace the MapFeature at x, y"""
+        self._ids[y*self.width + x] = 0 if feature is None else self._intern(feature)
+
+    def get_tile_rows(self, x, y, width, height):
+        """Return a 2d list of the tiles in the width x height rectangle whose upper left
+        corner is at x, y. The rectangle must lie inside the grid.
+        """
+        tile_lookup = self.tiles.__getitem__
+        rows = []
+        start = y*self.width + x
+        for row_start in range(start, start + height*self.width, self.width):
+            rows.append(list(map(tile_lookup, self._ids[row_start:row_start+width])))
+        return rows
+
+    def get_opacity(self):
+        """Return a bytearray with one byte per cell, row by row, which is 1 where the
+        feature in that cell is opaque and 0 elsewhere
+        """
+        return self._get_flags("opaque")
+
+    def get_passability(self):
+        """Return a bytearray with one byte per cell, row by row, which is 1 where the
+        feature in that cell is passable and 0 elsewhere
+        """
+        return self._get_flags("passable")
+
+    def new_bitset(self):
+        """Return an empty CellBitset with a bit for each cell of the grid"""
+        return CellBitset(self.width, self.height)
+
+    def __setstate__(self, state):
+        #The feature id lookup is keyed by object identity, which doesn't survive pickling
+        self.__dict__.update(state)
+        self._feature_ids = {id(feature): feature_id for feature_id, feature in enumerate(self.features)}
+
+    ## PRIVATE METHODS ##
+    def _get_flags(self, attribute):
+        """Return a bytearray with one byte per cell that is 1 where the feature in that
+        cell has attribute set, looking it up once per feature rather than once per cell
+        """
+        flags = [1 if getattr(feature, attribute) else 0 for feature in self.features]
+        return bytearray(map(flags.__getitem__, self._ids))
+
+    def _intern(self, feature):
+        """Return the id of feature, adding it to the feature table if necessary"""
+        key = id(feature)
+        feature_id = self._feature_ids.get(key)
+        if feature_id is None:
+            feature_id = len(self.features)
+            self.features.append(feature)
+            self.tiles.append(feature.tile)
+            self._feature_ids[key] = feature_id
+            if feature_id > _MAX_SMALL_ID and self._ids.typecode == _SMALL_IDS:
+                self._ids = array(_LARGE_IDS, self._ids)
+        return feature_id
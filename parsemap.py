@@ -43,6 +43,20 @@ def parse_file(map_file):
                 args - (optional) a list of arguments to pass to the entity's constructor
                 ksargs - (optional) a dict of keyword arguments to pass to the entity's constructor
     """
+    mapart, mapdetails, mapfeatures_by_coord, entities_list = read_map_file(map_file)
+
+    #Parse mapfeature and entity data to create actual game objects
+    mapfeatures = __parse_map_features(mapart, mapfeatures_by_coord)
+    entities = parse_entities(entities_list)
+
+    return (mapfeatures, entities, get_player_spawn(mapdetails))
+
+def read_map_file(map_file):
+    """Split a map file (see parse_file) into its parts without building any game objects
+
+    Return a tuple of the map art as a list of strings, then the "mapdetails", "mapfeatures"
+    and "entities" members of the JSON object, or empty defaults for any that are missing.
+    """
     #Read the file, strip leading and trailing whitespace, and break into a list of strings
     #by line
     file_text = map_file.read()
@@ -62,67 +76,103 @@ def parse_file(map_file):
     mapfeatures_by_coord = map_obj["mapfeatures"] if "mapfeatures" in map_obj else {}
     entities_list = map_obj["entities"] if "entities" in map_obj else []
 
-    #Parse mapfeature and entity data to create actual game objects
-    mapfeatures = __parse_map_features(mapart, mapfeatures_by_coord)
-    entities = __parse_entities(entities_list)
+    return (mapart, mapdetails, mapfeatures_by_coord, entities_list)
 
-    #Pull player spawn info from mapdetails
+def get_player_spawn(mapdetails):
+    """Pull player spawn info from mapdetails"""
     if "player_spawn_x" in mapdetails and "player_spawn_y" in mapdetails:
-        player_spawn = (mapdetails["player_spawn_x"], mapdetails["player_spawn_y"])
+        return (mapdetails["player_spawn_x"], mapdetails["player_spawn_y"])
+    return (0,0)
+
+def describe_map_feature(cell, obj=None):
+    """Work out how to build the MapFeature for one cell of map art
+
+    cell: The character in the map art
+    obj: The cell's entry in the "mapfeatures" JSON object, if it has one
+    Return a (MapFeature subclass, args, kwargs) tuple.
+    """
+    if obj is None:
+        return (__map_dict[cell] if cell in __map_dict else mapfeatures.Void, [], {})
+    if "classname" in obj:
+        mapfeature_class = getattr(sys.modules["mapfeatures"], obj["classname"])
+    elif cell in __map_dict:
+        mapfeature_class = __map_dict[cell]
     else:
-        player_spawn = (0,0)
+        mapfeature_class = mapfeatures.Void
+    tilechar = obj["tilechar"] if "tilechar" in obj else cell
+    #Copy args, so that describing the same cell twice doesn't pile up extra arguments
+    args = list(obj["args"]) if "args" in obj else []
+    args.append(tilechar)
+    if 'fgcolor' in obj:
+        args.append(obj['fgcolor'])
+    if 'bgcolor' in obj:
+        args.append(obj['bgcolor'])
+    if 'bold' in obj:
+        args.append(obj['bold'])
+    kwargs = obj["kwargs"] if "kwargs" in obj else {}
+    return (mapfeature_class, args, kwargs)
 
-    return (mapfeatures, entities, player_spawn)
+def index_mapfeature_overrides(mapfeatures_by_coord):
+    """Turn the "x,y" keys of the "mapfeatures" JSON object into a dict of rows, so that
+    {"3,4": obj} becomes {4: {3: obj}}
+    """
+    overrides_by_row = {}
+    for coords, obj in mapfeatures_by_coord.items():
+        x, y = coords.split(',')
+        overrides_by_row.setdefault(int(y), {})[int(x)] = obj
+    return overrides_by_row
 
 def __parse_map_features(mapart, mapfeatures_by_coord):
     """Read a description of a map from a file and generate a matrix of map features"""
     mapfeatures_matrix = []
+    overrides_by_row = index_mapfeature_overrides(mapfeatures_by_coord)
+
+    #Plain cells of flyweight classes all share one feature per character, so a row of
+    #them can be translated in one go. Anything stateful is left as None to be filled in.
+    plain_features = {}
+    stateful_chars = set()
+    for cell in set().union(*mapart):
+        mapfeature_class = __map_dict[cell] if cell in __map_dict else mapfeatures.Void
+        if mapfeature_class.flyweight:
+            plain_features[cell] = mapfeature_class()
+        else:
+            plain_features[cell] = None
+            stateful_chars.add(cell)
+    get_plain_feature = plain_features.__getitem__
 
     for y, line in enumerate(mapart):
-        parsed_line = []
-        for x, cell in enumerate(line):
-            if "{0},{1}".format(x, y) in mapfeatures_by_coord:
-                obj = mapfeatures_by_coord["{0},{1}".format(x, y)]
-                if "classname" in obj:
-                    mapfeature_class = getattr(sys.modules["mapfeatures"], obj["classname"])
-                elif cell in __map_dict:
-                    mapfeature_class = __map_dict[cell]
-                else:
-                    mapfeature_class = mapfeatures.Void
-                tilechar = obj["tilechar"] if "tilechar" in obj else cell
-                args = obj["args"] if "args" in obj else []
-                args.append(tilechar)
-                if 'fgcolor' in obj:
-                    args.append(obj['fgcolor'])
-                if 'bgcolor' in obj:
-                    args.append(obj['bgcolor'])
-                if 'bold' in obj:
-                    args.append(obj['bold'])
-                kwargs = obj["kwargs"] if "kwargs" in obj else {}
-                feature = mapfeature_class(*args, **kwargs)
-            else:
-                feature = __map_dict[cell]() if cell in __map_dict else mapfeatures.Void()
-            parsed_line.append(feature)
+        parsed_line = list(map(get_plain_feature, line))
+        for cell in stateful_chars:
+            x = line.find(cell)
+            while x != -1:
+                parsed_line[x] = __map_dict[cell]()
+                x = line.find(cell, x+1)
+        if y in overrides_by_row:
+            for x, obj in overrides_by_row[y].items():
+                if 0 <= x < len(line):
+                    mapfeature_class, args, kwargs = describe_map_feature(line[x], obj)
+                    parsed_line[x] = mapfeature_class(*args, **kwargs)
         mapfeatures_matrix.append(parsed_line)
     return mapfeatures_matrix
 
-def __parse_entities(json_entities):
+def parse_entities(json_entities):
     """Build a list of callable game object constructors from a list of JSON objects"""
-
     parsed_entities = []
+    entity_classes = {}
     for entity_obj in json_entities:
         x_coord = int(entity_obj['x_coord'])
         y_coord = int(entity_obj['y_coord'])
         fgcolor = entity_obj['fgcolor'] if 'fgcolor' in entity_obj else "WHITE"
         bgcolor = entity_obj['bgcolor'] if 'bgcolor' in entity_obj else "BLACK"
         tile = Tile(entity_obj['tilechar'], fgcolor, bgcolor) if 'tilechar' in entity_obj else None
-        args = entity_obj['args'] if 'args' in entity_obj else []
+        args = list(entity_obj['args']) if 'args' in entity_obj else []
         if tile is not None:
             args.append(tile)
         args.append(x_coord)
         args.append(y_coord)
         kwargs = entity_obj['kwargs'] if 'kwargs' in entity_obj else {}
-        entity_class = getattr(sys.modules["entities"], entity_obj['classname'])
-        entity_partial = functools.partial(entity_class, *args, **kwargs)
-        parsed_entities.append(entity_partial)
+        classname = entity_obj['classname']
+        if classname not in entity_classes:
+            entity_classes[classname] = getattr(sys.modules["entities"], classname)
+        parsed_entities.append(functools.partial(entity_classes[classname], *args, **kwargs))
     return parsed_entities
@@ -0,0 +1,76 @@
+"""A module for answering whether a cell of a map can be walked onto
+
+A PassabilityGrid keeps a bytearray with one byte per cell, 1 where the cell can be
+entered. It combines the map's features (see MapFeature.passable) with the entities that
+block movement (see Entity.blocks_movement), and is kept up to date as features change
+and entities come, go and move, so checking a cell is a single array read.
+"""
+
+class PassabilityGrid():
+    """Which cells of one map can be walked onto
+
+    mapgrid: The map's MapGrid, or anything else with its get_passability method
+    entities: The entities already on the map
+    """
+
+    def __init__(self, mapgrid, entities=()):
+        self.width = mapgrid.width
+        self.height = mapgrid.height
+        #1 where the map feature in a cell can be walked on, whatever is standing there
+        self._features = mapgrid.get_passability()
+        #Cell (as y*width + x) -> how many blocking entities are in it
+        self._blockers = {}
+        #1 where a cell can be entered right now
+        self.cells = mapgrid.get_passability()
+
+        for entity in entities:
+            self.add(entity)
+
+    def is_passable(self, x, y):
+        """Return whether something can walk onto x, y. Nothing can walk off the map."""
+        return 0 <= x < self.width and 0 <= y < self.height and self.cells[y*self.width + x] == 1
+
+    def set_feature(self, x, y, feature):
+        """Called when the map feature at x, y is replaced with feature"""
+        index = y*self.width + x
+        self._features[index] = 1 if feature.passable else 0
+        if index not in self._blockers:
+            self.cells[index] = self._features[index]
+
+    def add(self, entity):
+        """Called when entity is put on the map"""
+        if entity.blocks_movement:
+            self._block(entity.x, entity.y)
+
+    def remove(self, entity):
+        """Called when entity is taken off the map"""
+        if entity.blocks_movement:
+            self._unblock(entity.x, entity.y)
+
+    def move(self, entity, old_x, old_y):
+        """Called after entity moves from old_x, old_y to its current position"""
+        if entity.blocks_movement:
+            self._unblock(old_x, old_y)
+            self._block(entity.x, entity.y)
+
+    def blocking_changed(self, entity):
+        """Called after entity starts or stops blocking movement where it stands"""
+        if entity.blocks_movement:
+            self._block(entity.x, entity.y)
+        else:
+            self._unblock(entity.x, entity.y)
+
+    ## PRIVATE METHODS ##
+    def _block(self, x, y):
+        index = y*self.width + x
+        self._blockers[index] = self._blockers.get(index, 0) + 1
+        self.cells[index] = 0
+
+    def _unblock(self, x, y):
+        index = y*self.width + x
+        count = self._blockers[index] - 1
+        if count > 0:
+            self._blockers[index] = count
+        else:
+            del self._blockers[index]
+            self.cells[index] = self._features[index]
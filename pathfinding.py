@@ -0,0 +1,196 @@
+"""A module for finding the way across a map
+
+Passability is a bytearray with one byte per cell of the map, row by row, nonzero where
+something can walk (see MapGrid.get_passability). find_path runs A* from one point to
+another. When many walkers are headed the same way, such as every monster chasing the
+player, a DistanceMap works out every cell's distance to the nearest of its targets once,
+and each walker just steps downhill from wherever it is. A Pathfinder caches distance
+maps, and only builds one again when its targets or the map's passability change.
+
+Every step costs 1, diagonal or not, just as moving does in the game.
+"""
+import heapq
+from array import array
+from collections import OrderedDict, deque
+
+#The distance of a cell no target can be reached from
+UNREACHABLE = 0xFFFFFFFF
+
+#Offsets of a cell's neighbors, orthogonal ones first
+NEIGHBORS_8 = ((0, -1), (1, 0), (0, 1), (-1, 0), (1, -1), (1, 1), (-1, 1), (-1, -1))
+NEIGHBORS_4 = NEIGHBORS_8[:4]
+
+def find_path(passable, width, height, start, goal, diagonal=True):
+    """Return a shortest path from start to goal as a list of (x, y) steps, not including
+    start, or None if goal can't be reached. start itself doesn't have to be passable.
+
+    diagonal: Whether steps can be diagonal, or only up, down, left and right
+    """
+    if start == goal:
+        return []
+    g_x, g_y = goal
+    if not (0 <= g_x < width and 0 <= g_y < height) or not passable[g_y*width + g_x]:
+        return None
+    steps = NEIGHBORS_8 if diagonal else NEIGHBORS_4
+
+    def estimate(x, y):
+        d_x = abs(x - g_x)
+        d_y = abs(y - g_y)
+        return max(d_x, d_y) if diagonal else d_x + d_y
+
+    start_index = start[1]*width + start[0]
+    goal_index = g_y*width + g_x
+    #cell -> the cell it was best reached from
+    came_from = {start_index: None}
+    #cell -> the cheapest cost of reaching it found so far
+    costs = {start_index: 0}
+    #Ties in estimated total go to the cell furthest along, so straight runs finish fast
+    open_cells = [(estimate(*start), 0, start_index)]
+    while open_cells:
+        total, cost, index = heapq.heappop(open_cells)
+        cost = -cost
+        if index == goal_index:
+            break
+        if cost > costs[index]:
+            #A cheaper way here was already expanded
+            continue
+        y, x = divmod(index, width)
+        cost += 1
+        for d_x, d_y in steps:
+            n_x = x + d_x
+            n_y = y + d_y
+            if 0 <= n_x < width and 0 <= n_y < height:
+                n_index = n_y*width + n_x
+                if passable[n_index] and cost < costs.get(n_index, UNREACHABLE):
+                    costs[n_index] = cost
+                    came_from[n_index] = index
+                    heapq.heappush(open_cells, (cost + estimate(n_x, n_y), -cost, n_index))
+    else:
+        return None
+
+    path = []
+    index = goal_index
+    while index != start_index:
+        y, x = divmod(index, width)
+        path.append((x, y))
+        index = came_from[index]
+    path.reverse()
+    return path
+
+class DistanceMap():
+    """Every cell's distance to the nearest of a set of targets: a multi-source Dijkstra
+    map, which doubles as a flow field that walkers follow downhill
+
+    targets: An iterable of (x, y) cells. Ones that are off the map or impassable are ignored.
+    diagonal: Whether steps can be diagonal, or only up, down, left and right
+    """
+
+    def __init__(self, passable, width, height, targets, diagonal=True):
+        self.width = width
+        self.height = height
+        self.targets = frozenset(targets)
+        self.diagonal = diagonal
+        self.distances = array('I', [UNREACHABLE]) * (width*height)
+        self._steps = NEIGHBORS_8 if diagonal else NEIGHBORS_4
+
+        #Steps all cost the same, so a breadth-first search finds cells in order of distance
+        distances = self.distances
+        frontier = deque()
+        for x, y in self.targets:
+            if 0 <= x < width and 0 <= y < height and passable[y*width + x]:
+                distances[y*width + x] = 0
+                frontier.append(y*width + x)
+        steps = [(d_x, d_y*width + d_x) for d_x, d_y in self._steps]
+        size = width*height
+        while frontier:
+            index = frontier.popleft()
+            x = index % width
+            distance = distances[index] + 1
+            for d_x, offset in steps:
+                n_index = index + offset
+                if 0 <= x + d_x < width and 0 <= n_index < size and \
+                        distances[n_index] == UNREACHABLE and passable[n_index]:
+                    distances[n_index] = distance
+                    frontier.append(n_index)
+
+    def get_distance(self, x, y):
+        """Return how many steps x, y is from the nearest target, or None if it can't reach one"""
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+        distance = self.distances[y*self.width + x]
+        return None if distance == UNREACHABLE else distance
+
+    def next_step(self, x, y):
+        """Return the neighbor of x, y that is one step nearer a target, or None if x, y
+        is a target already or can't reach one
+        """
+        width = self.width
+        distances = self.distances
+        best = self.get_distance(x, y)
+        if best is None:
+            #Off the map, or a walker standing somewhere impassable: take any step onto the map
+            best = UNREACHABLE
+        step = None
+        for d_x, d_y in self._steps:
+            n_x = x + d_x
+            n_y = y + d_y
+            if 0 <= n_x < width and 0 <= n_y < self.height and distances[n_y*width + n_x] < best:
+                best = distances[n_y*width + n_x]
+                step = (n_x, n_y)
+        return step
+
+class Pathfinder():
+    """Answers path queries for one map, caching distance maps until they go stale
+
+    passability: A bytearray of width*height bytes, row by row, nonzero where a cell is passable
+    cache_size: How many distance maps to keep
+    """
+
+    def __init__(self, passability, width, height, cache_size=16):
+        self.passability = passability
+        self.width = width
+        self.height = height
+        self.cache_size = cache_size
+        #(targets, diagonal) -> DistanceMap, least recently used first
+        self._cache = OrderedDict()
+
+    def __getstate__(self):
+        #Distance maps are as big as the map and can always be rebuilt, so don't pickle them
+        state = self.__dict__.copy()
+        state["_cache"] = OrderedDict()
+        return state
+
+    def is_passable(self, x, y):
+        """Return whether something can walk onto x, y. Nothing can walk off the map."""
+        return 0 <= x < self.width and 0 <= y < self.height and self.passability[y*self.width + x] != 0
+
+    def set_passable(self, x, y, passable):
+        """Change whether x, y can be walked on, forgetting every cached distance map if
+        that changes anything
+        """
+        index = y*self.width + x
+        if bool(self.passability[index]) == bool(passable):
+            return
+        self.passability[index] = 1 if passable else 0
+        self._cache.clear()
+
+    def find_path(self, start, goal, diagonal=True):
+        """Return a shortest path from start to goal, as find_path does"""
+        return find_path(self.passability, self.width, self.height, start, goal, diagonal)
+
+    def get_distance_map(self, targets, diagonal=True):
+        """Return a DistanceMap to targets, an iterable of (x, y) cells. Asking again with
+        the same targets returns the same DistanceMap until the passability changes, so
+        any number of walkers can share one each turn.
+        """
+        key = (frozenset(targets), diagonal)
+        distance_map = self._cache.get(key)
+        if distance_map is not None:
+            self._cache.move_to_end(key)
+            return distance_map
+
+        distance_map = DistanceMap(self.passability, self.width, self.height, key[0], diagonal)
+        self._cache[key] = distance_map
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return distance_map
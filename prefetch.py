@@ -0,0 +1,69 @@
+"""A module for generating upcoming levels in the background
+
+Generating a level can take long enough to notice, so a LevelPrefetcher builds the next
+level or two in a worker process while the player is still busy with the current one.
+Each level is generated from its own seed, so it comes out the same whether it was
+prefetched or built on the spot.
+"""
+import multiprocessing
+import concurrent.futures
+
+import debugoutput
+from levelcache import generate_level
+
+class _WorkerContext():
+    """A multiprocessing context that keeps hold of every process it starts, so that a
+    LevelPrefetcher can stop its workers without waiting for them
+    """
+
+    def __init__(self):
+        self._context = multiprocessing.get_context()
+        self.processes = []
+
+    def __getattr__(self, name):
+        return getattr(self._context, name)
+
+    def Process(self, *args, **kwargs):
+        process = self._context.Process(*args, **kwargs)
+        self.processes.append(process)
+        return process
+
+class LevelPrefetcher():
+    """Generates levels in a worker process ahead of when they're needed"""
+
+    def __init__(self, max_workers=1):
+        self._context = _WorkerContext()
+        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=self._context)
+        #depth -> Future that will hold the generated GameMap
+        self._pending = {}
+
+    def request(self, depth, map_class, seed, kwargs, cache=None):
+        """Start generating the level at depth, unless it's already under way. See
+        levelcache.generate_level for the arguments.
+        """
+        if depth not in self._pending:
+            self._pending[depth] = self._executor.submit(generate_level, map_class, seed, depth, kwargs, cache)
+
+    def take(self, depth):
+        """Return the generated GameMap for depth, waiting for it if it isn't done yet,
+        or None if it was never requested or its generation failed
+        """
+        future = self._pending.pop(depth, None)
+        if future is None:
+            return None
+        try:
+            return future.result()
+        except Exception as e:
+            debugoutput.add_debug_string("Prefetching level {0} failed: {1}".format(depth, e))
+            return None
+
+    def shutdown(self):
+        """Abandon any queued work and stop the worker processes, without waiting for a
+        level that's half built
+        """
+        self._pending.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        #Nobody will take the level being generated, so there's no point letting it finish
+        for process in self._context.processes:
+            if process.is_alive():
+                process.terminate()
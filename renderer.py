@@ -0,0 +1,216 @@
+"""A module for drawing views of the game world into curses windows
+
+Renderers have a draw_world method that the game loop calls once a frame. They only stage
+their changes with noutrefresh; the game loop sends everything to the terminal with one
+doupdate per frame. DiffRenderer
+asks the world for the view around the player every frame and writes whatever changed.
+PadRenderer draws the whole map into a curses pad once, then scrolls it around and only
+touches the cells that entities moved in or out of.
+"""
+import curses
+import operator
+import itertools
+
+from session import Session
+from frametimer import NullFrameTimer
+
+get_char = operator.attrgetter("char")
+
+class DiffRenderer():
+    """Draws the game world into a curses window, only repainting cells that changed
+    since the previous frame. The window can also be a headless.HeadlessWindow.
+
+    session: The Session whose map changes should trigger a full repaint, and whose colors
+        to draw with. Defaults to the current one.
+    """
+
+    def __init__(self, window, session=None):
+        self.window = window
+        #The previous view drawn, or None if the next draw should repaint everything
+        self._last_frame = None
+        self._last_window_size = None
+
+        session = session if session is not None else Session.current()
+        self._get_color = session.color_registry.tile_colors.__getitem__
+        session.event_bus.listen("map_loaded", self.invalidate)
+
+    def invalidate(self, *args, **kwargs):
+        """Forget the previous frame, so that the next draw repaints every cell"""
+        self._last_frame = None
+
+    def draw_world(self, gameworld, timer=NullFrameTimer()):
+        """Draw the part of gameworld around the player that fits in the window"""
+        window_height, window_width = self.window.getmaxyx()
+        view = gameworld.get_view(view_width=window_width, view_height=window_height, center_on_player=True)
+        timer.mark("get_view")
+        self.draw(view)
+
+    def draw(self, view):
+        """Write the cells of view that differ from the previous frame and stage the window
+        for the next doupdate
+
+        view: A 2d list of tiles, as returned by GameWorld.get_view
+        """
+        #Tiles are interned, so the view itself can be compared with the last one
+        frame = view
+        #Fall back to a full repaint if the window was resized or the frame changed shape
+        window_size = self.window.getmaxyx()
+        last_frame = self._last_frame
+        if last_frame is None or window_size != self._last_window_size or \
+                len(last_frame) != len(frame) or \
+                (len(frame) > 0 and len(last_frame[0]) != len(frame[0])):
+            self.window.erase()
+            self._draw_full(frame)
+        else:
+            self._draw_changed(frame, last_frame)
+        self.window.noutrefresh()
+
+        self._last_frame = frame
+        self._last_window_size = window_size
+
+    ## PRIVATE METHODS ##
+    def _draw_full(self, frame):
+        """Write every tile of frame to the window, a run of same-colored tiles at a time"""
+        addstr = self.window.addstr
+        get_color = self._get_color
+        try:
+            for y, row in enumerate(frame):
+                x = 0
+                for color, tiles in itertools.groupby(row, get_color):
+                    text = "".join(map(get_char, tiles))
+                    addstr(y, x, text, color)
+                    x += len(text)
+        except curses.error:
+            #Writing the bottom right cell of a window fails once the cell is written,
+            #since the cursor can't move past it. Cells are written top to bottom, left
+            #to right, so nothing is left to draw.
+            pass
+
+    def _draw_changed(self, frame, last_frame):
+        """Write only the parts of frame that differ from last_frame: in each changed row,
+        the span from the first changed tile to the last, a run of same-colored tiles at
+        a time. Unchanged tiles inside the span are rewritten, but curses leaves those
+        off the terminal anyway.
+        """
+        addstr = self.window.addstr
+        get_color = self._get_color
+        try:
+            for y, (row, last_row) in enumerate(zip(frame, last_frame)):
+                if row == last_row:
+                    continue
+                start = 0
+                while row[start] is last_row[start]:
+                    start += 1
+                end = len(row)
+                while row[end-1] is last_row[end-1]:
+                    end -= 1
+                x = start
+                for color, tiles in itertools.groupby(row[start:end], get_color):
+                    text = "".join(map(get_char, tiles))
+                    addstr(y, x, text, color)
+                    x += len(text)
+        except curses.error:
+            #See _draw_full
+            pass
+
+class PadRenderer():
+    """Draws the game world by scrolling a curses pad holding the whole map
+
+    When a map is loaded, all of its map features are written to a pad. Each frame, the
+    pad is scrolled so the player is centered and copied into the window's area of the
+    screen. The only cells written are the ones where an entity appeared, moved away or
+    changed tile within the visible area, or whose map feature changed.
+
+    The pad holds entities only where they were visible in the last frame; the rest of
+    it shows bare map features, so entities off screen can move freely without anything
+    being written. With field of view on, the cells that came into or went out of sight
+    are rewritten too.
+
+    window: The window whose area of the screen the map is shown in
+    session: The Session whose map events to listen to, and whose colors to draw with.
+        Defaults to the current one.
+    newpad: The function to create pads with. A headless screen passes its own.
+    """
+
+    def __init__(self, window, session=None, newpad=curses.newpad):
+        self.window = window
+        self._newpad = newpad
+        self._pad = None
+        #(x, y) -> Tile of each entity drawn onto the pad
+        self._shown = {}
+        #Cells whose map feature changed since the last frame
+        self._changed_features = []
+        #The gameworld's visible cells as of the last frame
+        self._last_visible = None
+
+        session = session if session is not None else Session.current()
+        self._get_color = session.color_registry.tile_colors.__getitem__
+        session.event_bus.listen("map_loaded", self.invalidate)
+        session.event_bus.listen("map_feature_changed", self.mark_feature_changed)
+
+    def invalidate(self, *args, **kwargs):
+        """Throw the pad away, so that the next draw builds it again from the current map"""
+        self._pad = None
+
+    def mark_feature_changed(self, x, y):
+        """Rewrite the cell at x, y on the next draw"""
+        self._changed_features.append((x, y))
+
+    def draw_world(self, gameworld, timer=NullFrameTimer()):
+        """Update the pad and stage the part of it around the player for the next doupdate"""
+        if self._pad is None:
+            self._build_pad(gameworld)
+
+        window_height, window_width = self.window.getmaxyx()
+        o_x, o_y, view_width, view_height = gameworld.get_view_rect(
+                view_width=window_width, view_height=window_height, center_on_player=True)
+        visible = gameworld.get_visible_cells()
+        shown = {}
+        for entity in gameworld.get_entities_in_rect(o_x, o_y, view_width, view_height):
+            if visible is None or entity.y*gameworld.width + entity.x in visible:
+                shown[(entity.x, entity.y)] = entity.tile
+        timer.mark("get_view")
+
+        pad = self._pad
+        get_color = self._get_color
+        last_shown = self._shown
+        changed_cells = list(self._changed_features)
+        changed_cells.extend(last_shown.keys() - shown.keys())
+        if visible is not self._last_visible:
+            changed_cells.extend(divmod(index, gameworld.width)[::-1]
+                                 for index in visible.symmetric_difference(self._last_visible))
+            self._last_visible = visible
+        for (x, y) in changed_cells:
+            if (x, y) not in shown:
+                tile = gameworld.get_cell_tile(x, y)
+                pad.addstr(y, x, tile.char, get_color(tile))
+        for (x, y), tile in shown.items():
+            if last_shown.get((x, y)) is not tile:
+                pad.addstr(y, x, tile.char, get_color(tile))
+        self._changed_features = []
+        self._shown = shown
+
+        top, left = self.window.getbegyx()
+        pad.noutrefresh(o_y, o_x, top, left, top + view_height - 1, left + view_width - 1)
+
+    ## PRIVATE METHODS ##
+    def _build_pad(self, gameworld):
+        """Write every map feature of gameworld's current map to a new pad"""
+        #One spare column, since curses won't write to the last cell of a pad
+        pad = self._newpad(gameworld.height, gameworld.width + 1)
+        rows = gameworld.get_view(with_entities=False)
+        get_color = self._get_color
+        for y, row in enumerate(rows):
+            x = 0
+            for color, tiles in itertools.groupby(row, get_color):
+                text = "".join(map(get_char, tiles))
+                pad.addstr(y, x, text, color)
+                x += len(text)
+        self._pad = pad
+        self._shown = {}
+        self._changed_features = []
+        self._last_visible = gameworld.get_visible_cells()
+
+        #Clear whatever the window showed before, in case the new map doesn't fill it
+        self.window.erase()
+        self.window.noutrefresh()
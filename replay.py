@@ -0,0 +1,74 @@
+"""A module for recording games and playing them back
+
+A Recording holds everything needed to play a game again exactly as it went: the world
+seed, the map file, which kind of world it was and how far the player could see, the
+screen size (which decides how messages wrap, and so how many keys the message panel
+waits for), and every key that was read. Replaying feeds those keys to a headless screen
+as fast as the game can take them.
+"""
+import json
+
+RECORDING_VERSION = 2
+#Older versions that can still be loaded, leaving the options they didn't save at their
+#defaults
+COMPATIBLE_VERSIONS = (1, RECORDING_VERSION)
+
+class KeyRecorder():
+    """Wraps a curses window (or a headless.HeadlessWindow) and notes down every key read
+    from it or from any of its sub-windows, in order
+    """
+
+    def __init__(self, window, keys=None):
+        self._window = window
+        #Shared with every sub-window
+        self.keys = [] if keys is None else keys
+
+    def __getattr__(self, name):
+        return getattr(self._window, name)
+
+    def getkey(self):
+        key = self._window.getkey()
+        self.keys.append(key)
+        return key
+
+    def subwin(self, *args):
+        return KeyRecorder(self._window.subwin(*args), self.keys)
+
+class Recording():
+    """The inputs of one game
+
+    seed: The GameWorld's seed
+    keys: A list of key names, as getkey returns them
+    mapfile: The path of the map file the game was started with, or None
+    screen_size: The (rows, columns) of the screen the game was played on
+    overworld: Whether the game was played in the overworld rather than on mapfile
+    fov: The field of view radius the game was played with, or None if it was off
+    """
+
+    def __init__(self, seed, keys, mapfile=None, screen_size=(40, 120), overworld=False, fov=None):
+        self.seed = seed
+        self.keys = keys
+        self.mapfile = mapfile
+        self.screen_size = tuple(screen_size)
+        self.overworld = overworld
+        self.fov = fov
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({"version": RECORDING_VERSION,
+                       "seed": self.seed,
+                       "mapfile": self.mapfile,
+                       "screen_size": self.screen_size,
+                       "overworld": self.overworld,
+                       "fov": self.fov,
+                       "keys": self.keys}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") not in COMPATIBLE_VERSIONS:
+            raise ValueError("{0} is a version {1} recording; expected version {2}".format(
+                path, data.get("version"), RECORDING_VERSION))
+        return cls(data["seed"], data["keys"], data["mapfile"], data["screen_size"],
+                   overworld=data.get("overworld", False), fov=data.get("fov"))
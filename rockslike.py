@@ -1,48 +1,84 @@
 #!/usr/bin/env python3
 
 import sys
+import time
 import curses
 import argparse
 
+import events
 import debugoutput
 import keyinput
 import mapgenfuncs
+from renderer import DiffRenderer, PadRenderer
 from gameworld import GameWorld, GameMap
+from gameworld_overworld import OverworldGameWorld
 from screenpanels import MessagePanel, ListMenu
+from session import Session
+from headless import HeadlessWindow, HeadlessColorRegistry
+from replay import KeyRecorder, Recording
+from frametimer import FrameTimer, NullFrameTimer
 
-def draw_screen(stdscr, gameworld, gamewindow, panellist, show_debug_text=False):
-    """Display the current game state on the screen"""
+def draw_screen(stdscr, gameworld, gamerenderer, panellist, show_debug_text=False, draw_world=True,
+                timer=NullFrameTimer(), doupdate=curses.doupdate):
+    """Display the current game state on the screen
+
+    The panels and the renderer only stage their windows, and everything is sent to the
+    terminal at once at the end.
+
+    draw_world: If False, only the panels are updated. They still have to be, since they
+        read keys of their own.
+    timer: A FrameTimer to mark the drawing phases on
+    doupdate: The function that sends staged windows to the screen. A headless screen
+        passes its own.
+    """
 
     #Update non-game panels
     for panel in panellist:
         panel.display()
+    timer.mark("panels")
+    #Anything the panels set off, like a menu action, takes effect before the world is drawn
+    events.flush_events()
+    timer.mark("events")
+    if not draw_world:
+        doupdate()
+        return
 
     #Draw the gameworld to its window
-    window_height, window_width = gamewindow.getmaxyx()
-    view = gameworld.get_view(view_width=window_width, view_height=window_height, center_on_player=True)
-    for y, row in enumerate(view):
-        for x, tile in enumerate(row):
-            gamewindow.addstr(y, x, tile.char, tile.color)
-    gamewindow.refresh()
-
-    #Flush debug text
+    gamerenderer.draw_world(gameworld, timer)
+
+    #Flush debug text, with the frame timings on top, into its own rows above the game
     if show_debug_text:
+        for line in timer.get_overlay_lines():
+            debugoutput.add_debug_string(line)
+        debugoutput.add_debug_string(gameworld.get_level_summary())
         debugoutput.flush_debug_text()
+        stdscr.noutrefresh()
+    doupdate()
+    timer.mark("draw")
 
-def layout_panels(stdscr):
+def layout_panels(stdscr, session=None, debug_height=0):
     """Build panel layout and create sub-windows of stdscr
 
+    session: The Session the panels belong to
+    debug_height: How many rows to set aside between the message panel and the game
+        window for the session's debug text, or 0 to leave it drawing over the screen
     Return: A tuple with the game window and a list of other panels
     """
-    screen_width = curses.COLS-1
-    screen_height = curses.LINES-1
+    screen_height, screen_width = stdscr.getmaxyx()
+    screen_width -= 1
+    screen_height -= 1
     messagepanel_height = 5
     gamewindow_width = 3 * (screen_width // 4)
     #Arguments for creating sub-windows are height, width, y coord of top, x coord of left
     #0,0 is top left corner of the screen
-    messagepanel = MessagePanel(stdscr.subwin(messagepanel_height, gamewindow_width, 0, 0))
-    gamewindow = stdscr.subwin(screen_height-messagepanel_height, gamewindow_width, messagepanel_height+1, 0)
-    menupanel = ListMenu(stdscr.subwin(screen_height, (screen_width // 4), 0, gamewindow_width+1))
+    messagepanel = MessagePanel(stdscr.subwin(messagepanel_height, gamewindow_width, 0, 0), session=session)
+    if debug_height > 0:
+        #The renderers only redraw what they changed, so debug text mustn't overlap the game
+        debug_buffer = session.debug_buffer if session is not None else debugoutput.get_debug_buffer()
+        debug_buffer.set_window(stdscr.subwin(debug_height, gamewindow_width, messagepanel_height+1, 0))
+    gamewindow = stdscr.subwin(screen_height-messagepanel_height-debug_height, gamewindow_width,
+                               messagepanel_height+1+debug_height, 0)
+    menupanel = ListMenu(stdscr.subwin(screen_height, (screen_width // 4), 0, gamewindow_width+1), session=session)
     return (gamewindow, [messagepanel, menupanel])
 
 def main(stdscr):
@@ -50,31 +86,133 @@ def main(stdscr):
     args = get_args()
     curses.curs_set(False) #Turn off the cursor
     stdscr.clear() #Clear the screen
+    if args.record:
+        stdscr = KeyRecorder(stdscr)
+
+    #Everything this game triggers, prints and draws goes through its own session
+    session = Session(debug_buffer=debugoutput.DebugBuffer(stdscr))
+    with session.activate():
+        gameworld, turns = run_game(stdscr, args, session)
+    if args.record:
+        save_recording(args, stdscr, gameworld)
+
+def main_headless(args):
+    """Play the game without a terminal, drawing into an in-memory screen and taking the
+    keys given on the command line. Print the final screen when the keys run out.
+    """
+    height, width = args.screen_size
+    stdscr = HeadlessWindow(height, width, keys=args.keys)
+    if args.record:
+        stdscr = KeyRecorder(stdscr)
+    session = Session(debug_buffer=debugoutput.DebugBuffer(stdscr),
+                      color_registry=HeadlessColorRegistry())
+    start = time.perf_counter()
+    with session.activate():
+        gameworld, turns = run_game(stdscr, args, session, headless=True)
+    elapsed = time.perf_counter() - start
+    if args.record:
+        save_recording(args, stdscr, gameworld)
+    print("\n".join(stdscr.get_lines()))
+    print("{0} keys, {1} refreshes in {2:.3f}s".format(len(args.keys), stdscr.frames[0], elapsed))
+
+def main_replay(args):
+    """Play back a recorded game headlessly as fast as possible, and report how fast
+    the turns went by
+    """
+    recording = Recording.load(args.replay)
+    args.seed = recording.seed
+    args.mapfile = open(recording.mapfile) if recording.mapfile is not None else None
+    #Play in the same kind of world, seeing as far, as the recorded game did
+    args.overworld = recording.overworld
+    args.fov = recording.fov
+    if args.overworld and args.pad:
+        sys.exit("--pad can't be used to replay a game recorded with --overworld")
+    stdscr = HeadlessWindow(*recording.screen_size, keys=recording.keys)
+    session = Session(debug_buffer=debugoutput.DebugBuffer(stdscr),
+                      color_registry=HeadlessColorRegistry())
+    start = time.perf_counter()
+    with session.activate():
+        gameworld, turns = run_game(stdscr, args, session, render_every=args.render_every, headless=True)
+    elapsed = time.perf_counter() - start
+    if args.render_every > 0:
+        print("\n".join(stdscr.get_lines()))
+    print("{0} turns ({1} keys) in {2:.3f}s: {3:.0f} turns/s".format(
+        turns, len(recording.keys), elapsed, turns / elapsed if elapsed > 0 else 0))
+    print(gameworld.get_level_summary())
 
+def save_recording(args, recorder, gameworld):
+    """Write the keys read through recorder, and what's needed to replay them, to args.record"""
+    mapfile = args.mapfile.name if args.mapfile is not None else None
+    Recording(gameworld.seed, recorder.keys, mapfile, recorder.getmaxyx(),
+              overworld=args.overworld, fov=args.fov).save(args.record)
+
+def run_game(stdscr, args, session, render_every=1, headless=False):
+    """Set up the game in the active session and run the game loop until the user quits
+
+    stdscr: A curses window, or a headless.HeadlessWindow
+    render_every: Draw the game world every this many turns, or never if it's 0
+    headless: Whether stdscr is a headless.HeadlessWindow
+    Return: The GameWorld and the number of turns played
+    """
     show_debug_text = args.debugging_output
-    debugoutput.init(stdscr)
+    #Hold side-effect events like messages and entity removal until the end of each turn
+    events.set_deferred(True)
 
-    gamewindow, panellist = layout_panels(stdscr)
-    if args.mapfile:
+    #Room for the frame timings and the level summary
+    debug_height = 10 if show_debug_text else 0
+    gamewindow, panellist = layout_panels(stdscr, session=session, debug_height=debug_height)
+    if args.pad and headless:
+        gamerenderer = PadRenderer(gamewindow, session=session, newpad=stdscr.newpad)
+    elif args.pad:
+        gamerenderer = PadRenderer(gamewindow, session=session)
+    else:
+        gamerenderer = DiffRenderer(gamewindow, session=session)
+    if args.overworld:
+        gameworld = OverworldGameWorld(seed=args.seed, fov_radius=args.fov, session=session)
+    elif args.mapfile:
         gameworld = GameWorld(genfunc=mapgenfuncs.load_from_file,
-                              mapfile=args.mapfile)
+                              mapfile=args.mapfile,
+                              seed=args.seed, level_cache_dir=args.level_cache,
+                              fov_radius=args.fov, session=session)
     else:
         gameworld = GameWorld(genfunc=mapgenfuncs.empty_box, 
-                              width=20, height=20)
+                              width=20, height=20,
+                              seed=args.seed, level_cache_dir=args.level_cache,
+                              fov_radius=args.fov, session=session)
+
+    doupdate = stdscr.doupdate if headless else curses.doupdate
 
     #GAME LOOP
-    while True:
-        try:
-            draw_screen(stdscr, gameworld, gamewindow, panellist, show_debug_text=show_debug_text)
-            keyinput.handle_key(stdscr.getkey())
+    #Only time frames if someone will see the timings
+    if show_debug_text or args.trace is not None:
+        timer = FrameTimer(keep_trace=args.trace is not None)
+    else:
+        timer = NullFrameTimer()
+    turns = 0
+    try:
+        while True:
+            draw_world = render_every > 0 and turns % render_every == 0
+            draw_screen(stdscr, gameworld, gamerenderer, panellist,
+                        show_debug_text=show_debug_text, draw_world=draw_world, timer=timer,
+                        doupdate=doupdate)
+            key = stdscr.getkey()
+            timer.mark("input_wait")
+            keyinput.handle_key(key, session)
+            timer.mark("keys")
             gameworld.update_world()
-        except KeyboardInterrupt:
-            #The user pressed Ctrl-C
-            stdscr.refresh()
-            sys.exit()
-        except SystemExit:
-            stdscr.refresh()
-            sys.exit()
+            timer.mark("world")
+            events.flush_events()
+            timer.mark("events")
+            timer.end_frame()
+            turns += 1
+    except (KeyboardInterrupt, SystemExit):
+        #The user pressed Ctrl-C (or a headless game ran out of keys)
+        stdscr.refresh()
+    finally:
+        gameworld.close()
+    if args.trace is not None:
+        timer.write_trace(args.trace)
+    return gameworld, turns
 
 def get_args():
     """Parse the command line arguments and return a dictionary"""
@@ -99,11 +237,48 @@ def get_args():
             help="Path to a text file describing a game map",
             type=argparse.FileType('r'))
     parser.add_argument("-D", "--debugging-output", help="Print debugging messages", action="store_true")
-    return parser.parse_args()
+    parser.add_argument("-s", "--seed", help="Seed for level generation, to get the same levels every time", type=int)
+    parser.add_argument("--level-cache", help="Directory to save generated levels in and load them from", metavar="DIR")
+    parser.add_argument("--pad", help="Draw each map once into a curses pad and scroll it, rather than redrawing the view every turn",
+            action="store_true")
+    parser.add_argument("--fov", help="Only show what the player can see within RADIUS cells, and dim what they've seen before",
+            metavar="RADIUS", type=int)
+    parser.add_argument("--overworld", help="Explore an open-ended wilderness, generated in chunks as you walk and stored away behind you",
+            action="store_true")
+    parser.add_argument("--headless", help="Run without a terminal, playing the keys given by --keys", action="store_true")
+    parser.add_argument("--keys", help="Keys to press, one character each, when running headless", default="")
+    parser.add_argument("--screen-size", help="Size of the screen when running headless (default 40x120)",
+            metavar="ROWSxCOLS", default=(40, 120), type=parse_screen_size)
+    parser.add_argument("--trace", help="Save how long each phase of every frame took to FILE (.csv, otherwise JSON)",
+            metavar="FILE")
+    parser.add_argument("--record", help="Save the seed and every key pressed to FILE, to replay later", metavar="FILE")
+    parser.add_argument("--replay", help="Play back a game saved with --record, as fast as possible, and report turns per second",
+            metavar="FILE")
+    parser.add_argument("--render-every", help="When replaying, draw the game world every N turns (default 0: never)",
+            metavar="N", default=0, type=int)
+    args = parser.parse_args()
+    if args.overworld and args.pad:
+        #The pad holds the whole map, which would mean generating the whole overworld
+        parser.error("--pad can't be used with --overworld")
+    return args
+
+def parse_screen_size(size_str):
+    """Turn a string like "40x120" into a (rows, columns) tuple"""
+    try:
+        rows, cols = (int(n) for n in size_str.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected ROWSxCOLS, like 40x120, not {0}".format(size_str))
+    return (rows, cols)
 
 if __name__ == "__main__":
     #Parse the command line arguments before curses so that the help message can show
-    get_args()
+    args = get_args()
+    if args.replay:
+        main_replay(args)
+        sys.exit()
+    if args.headless:
+        main_headless(args)
+        sys.exit()
 
     #This will run the main function in a curses scope, and clean up
     #the terminal mode when the program ends.
@@ -0,0 +1,104 @@
+"""A module for deciding when each actor in the world gets to act
+
+Actors spend energy on their actions. After acting, an actor waits in a priority queue
+for a time that depends on what its action cost and how fast it is, so faster actors act
+more often. Actors with nothing to do can go to sleep, which takes them out of the queue
+entirely until something wakes them up.
+"""
+import heapq
+
+#The speed of an ordinary actor, and the cost of an ordinary action. An actor with twice
+#the speed acts twice as often; an action with twice the cost takes twice as long.
+NORMAL_SPEED = 100
+ACTION_COST = 100
+
+class TurnScheduler():
+    """A heap of actors keyed on the time of their next action
+
+    Actors are entities with a speed above 0 and a take_turn method, which acts and returns
+    the energy cost of what it did, or None to go to sleep. Anything else is ignored.
+    However cheap an action or fast an actor, its next turn comes at least 1 time unit later.
+    """
+
+    def __init__(self, actors=()):
+        self.time = 0
+        #Heap of [action time, tie breaker, actor] entries. Removing an actor blanks its
+        #entry's actor instead of searching the heap for it.
+        self._queue = []
+        #actor -> its entry in self._queue
+        self._entries = {}
+        self._sleeping = set()
+        self._next_tie_breaker = 0
+        #The actor whose take_turn is running, or None if it was removed while acting
+        self._acting = None
+
+        for actor in actors:
+            self.add(actor)
+
+    def __len__(self):
+        """The number of actors waiting to act, not counting sleeping ones"""
+        return len(self._entries)
+
+    def add(self, actor, delay=0):
+        """Schedule actor to act delay time units from now"""
+        if actor.speed <= 0 or actor in self._entries:
+            return
+        self._sleeping.discard(actor)
+        entry = [self.time + delay, self._next_tie_breaker, actor]
+        self._next_tie_breaker += 1
+        self._entries[actor] = entry
+        heapq.heappush(self._queue, entry)
+        self._compact()
+
+    def remove(self, actor):
+        """Forget about actor, whether it was waiting or sleeping"""
+        entry = self._entries.pop(actor, None)
+        if entry is not None:
+            entry[2] = None
+        self._sleeping.discard(actor)
+        if actor is self._acting:
+            self._acting = None
+
+    def sleep(self, actor):
+        """Stop scheduling actor until it's woken up"""
+        self.remove(actor)
+        if actor.speed > 0:
+            self._sleeping.add(actor)
+
+    def wake(self, actor, delay=0):
+        """Schedule a sleeping actor again"""
+        if actor in self._sleeping:
+            self.add(actor, delay)
+
+    def is_sleeping(self, actor):
+        return actor in self._sleeping
+
+    def advance(self, duration):
+        """Move time forward by duration, letting every actor whose turn comes up in that
+        time act, in order
+        """
+        end_time = self.time + duration
+        while len(self._queue) > 0 and self._queue[0][0] <= end_time:
+            action_time, _, actor = heapq.heappop(self._queue)
+            if actor is None:
+                continue
+            del self._entries[actor]
+            self.time = action_time
+            self._acting = actor
+            cost = actor.take_turn()
+            if self._acting is None:
+                continue #The actor was removed (maybe it died) during its turn
+            self._acting = None
+            if cost is None:
+                self._sleeping.add(actor)
+            else:
+                #A delay of 0 would put the actor straight back at the front of the queue
+                self.add(actor, max(1, cost * NORMAL_SPEED // actor.speed))
+        self.time = end_time
+
+    ## PRIVATE METHODS ##
+    def _compact(self):
+        """Rebuild the heap without removed entries once they make up most of it"""
+        if len(self._queue) > 2 * len(self._entries) + 16:
+            self._queue = [entry for entry in self._queue if entry[2] is not None]
+            heapq.heapify(self._queue)
@@ -2,13 +2,17 @@
 import collections
 import curses
 
-import events
+from session import Session
 
 class TextPanel():
-    """Displays and formats text in a curses window"""
+    """Displays and formats text in a curses window
 
-    def __init__(self, window):
+    session: The Session whose events the panel listens to. Defaults to the current one.
+    """
+
+    def __init__(self, window, session=None):
         self.window = window
+        self.session = session if session is not None else Session.current()
         #The height within the window where the next line
         #of text should be drawn:
         self.next_line = 1 #1 not 0, to account for window border
@@ -60,8 +64,9 @@ class TextPanel():
                     #if we haven't added any words at all this iteration, break the first word into 
                     #two words and try again.
                     stupid_long_word = message.pop()
-                    first_part = stupid_long_word[:width-2] + '-'
-                    second_part = stupid_long_word[width-2:]
+                    #Leave room for the leading space and the hyphen
+                    first_part = stupid_long_word[:width-3] + '-'
+                    second_part = stupid_long_word[width-3:]
                     message.append(second_part)
                     message.append(first_part)
                 else:
@@ -96,12 +101,14 @@ class TextPanel():
 class MessagePanel(TextPanel):
     """Displays game messages to the player"""
 
-    def __init__(self, window):
-        super(MessagePanel, self).__init__(window)
+    def __init__(self, window, session=None):
+        super(MessagePanel, self).__init__(window, session)
         self._message_queue = collections.deque()
         self.more_messages_string = "==MORE=="
 
-        events.listen_to_event("print_message", self.add_message)
+        #In deferred mode, all the messages from one turn are shown together
+        self.session.event_bus.defer("print_message", merge=lambda queued, new: (queued[0] + "\n" + new[0],))
+        self.session.event_bus.listen("print_message", self.add_message)
 
     def add_message(self, text):
         """Add a message to be displayed next turn"""
@@ -125,7 +132,7 @@ class MessagePanel(TextPanel):
             self.window.getkey()
             self.window.clear()
             self._reset_line_position()
-        self.window.refresh()
+        self.window.noutrefresh()
 
 class ListMenu(TextPanel):
     """Displays a list of selectable options"""
@@ -137,15 +144,15 @@ class ListMenu(TextPanel):
             self.text = text
             self.action = action
 
-    def __init__(self, window, menu_list=None):
-        super(ListMenu, self).__init__(window)
+    def __init__(self, window, menu_list=None, session=None):
+        super(ListMenu, self).__init__(window, session)
         self.active = False
 
         self.header = None
         self.menu_list = [] if menu_list is None else menu_list
         self.footer = None
 
-        events.listen_to_event("print_list", self.set_list)
+        self.session.event_bus.listen("print_list", self.set_list)
 
     def set_list(self, text_action_pairs, header = None, footer=None):
         """Wrap text and function pairs in ListMenuItems and set the current list
@@ -174,7 +181,7 @@ class ListMenu(TextPanel):
             self._reset_line_position()
             self.window.clear()
             self.active = False
-            self.window.refresh()
+            self.window.noutrefresh()
 
     def handle_key(self, key):
         """Handle keyboard input for the menu"""
@@ -0,0 +1,43 @@
+"""A module for running several independent games in one process
+
+Events, debug text and curses colors used to be module-level globals, so a process could
+only ever hold one game. A Session owns its own copy of each. Objects like GameWorld,
+Player and the screen panels are handed a session and listen on its event bus, and any
+code that runs inside session.activate() triggers events, prints debug text and looks up
+colors through that session rather than anyone else's.
+"""
+import contextlib
+
+import events
+import debugoutput
+import tile
+
+class Session():
+    """The event bus, debug buffer and color registry belonging to one game"""
+
+    def __init__(self, event_bus=None, debug_buffer=None, color_registry=None):
+        self.event_bus = event_bus if event_bus is not None else events.EventBus()
+        self.debug_buffer = debug_buffer if debug_buffer is not None else debugoutput.DebugBuffer()
+        self.color_registry = color_registry if color_registry is not None else tile.ColorRegistry()
+
+    @classmethod
+    def current(cls):
+        """Return a Session made of whatever the current context is using, which outside
+        of any activate() is the process-wide defaults
+        """
+        return cls(events.get_event_bus(), debugoutput.get_debug_buffer(), tile.get_color_registry())
+
+    @contextlib.contextmanager
+    def activate(self):
+        """Within this context, the module-level functions in events, debugoutput and tile
+        use this session's bus, buffer and registry
+        """
+        bus_token = events.set_event_bus(self.event_bus)
+        buffer_token = debugoutput.set_debug_buffer(self.debug_buffer)
+        registry_token = tile.set_color_registry(self.color_registry)
+        try:
+            yield self
+        finally:
+            tile.reset_color_registry(registry_token)
+            debugoutput.reset_debug_buffer(buffer_token)
+            events.reset_event_bus(bus_token)
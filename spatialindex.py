@@ -0,0 +1,104 @@
+"""A module for looking up entities by their position on a map
+
+Entities in a SpatialIndex tell it when they move, so lookups never have to scan every
+entity on the map. The index passes the news on to the map's PassabilityGrid, if it has one.
+"""
+
+class SpatialIndex():
+    """A spatial hash of entities, answering cell, rectangle and radius queries
+
+    Occupied cells are grouped into square buckets, so a rectangle query only visits the
+    buckets it overlaps and the cells in them that actually hold something.
+
+    passability: A passability.PassabilityGrid to keep up to date with where blocking
+        entities are, or None
+    """
+
+    def __init__(self, entities=(), bucket_size=16, passability=None):
+        self.bucket_size = bucket_size
+        self.passability = passability
+        #(x, y) -> list of entities in that cell, in the order they were added
+        self._cells = {}
+        #(bucket x, bucket y) -> set of occupied (x, y) cells in that bucket
+        self._buckets = {}
+        self._count = 0
+
+        for entity in entities:
+            self.add(entity)
+
+    def __len__(self):
+        return self._count
+
+    def add(self, entity):
+        """Start tracking entity at its current position"""
+        self._insert(entity, entity.x, entity.y)
+        entity.spatial_index = self
+        self._count += 1
+        if self.passability is not None:
+            self.passability.add(entity)
+
+    def remove(self, entity):
+        """Stop tracking entity"""
+        self._discard(entity, entity.x, entity.y)
+        entity.spatial_index = None
+        self._count -= 1
+        if self.passability is not None:
+            self.passability.remove(entity)
+
+    def move(self, entity, old_x, old_y):
+        """Called by an entity after it moves from old_x, old_y to its current position"""
+        if (old_x, old_y) != (entity.x, entity.y):
+            self._discard(entity, old_x, old_y)
+            self._insert(entity, entity.x, entity.y)
+            if self.passability is not None:
+                self.passability.move(entity, old_x, old_y)
+
+    def blocking_changed(self, entity):
+        """Called by an entity after it starts or stops blocking movement"""
+        if self.passability is not None:
+            self.passability.blocking_changed(entity)
+
+    def at(self, x, y):
+        """Return a list of the entities in the cell at x, y"""
+        return list(self._cells.get((x, y), ()))
+
+    def in_rect(self, x, y, width, height):
+        """Return a list of the entities in the width x height rectangle whose upper left
+        corner is at x, y
+        """
+        max_x = x + width
+        max_y = y + height
+        found = []
+        for bucket_y in range(y // self.bucket_size, (max_y-1) // self.bucket_size + 1):
+            for bucket_x in range(x // self.bucket_size, (max_x-1) // self.bucket_size + 1):
+                for cell in self._buckets.get((bucket_x, bucket_y), ()):
+                    if x <= cell[0] < max_x and y <= cell[1] < max_y:
+                        found.extend(self._cells[cell])
+        return found
+
+    def in_radius(self, x, y, radius):
+        """Return a list of the entities no more than radius cells (as the crow flies)
+        from x, y
+        """
+        candidates = self.in_rect(x - radius, y - radius, 2*radius + 1, 2*radius + 1)
+        return [e for e in candidates if (e.x - x)**2 + (e.y - y)**2 <= radius**2]
+
+    ## PRIVATE METHODS ##
+    def _insert(self, entity, x, y):
+        cell = (x, y)
+        if cell not in self._cells:
+            self._cells[cell] = []
+            bucket = (x // self.bucket_size, y // self.bucket_size)
+            self._buckets.setdefault(bucket, set()).add(cell)
+        self._cells[cell].append(entity)
+
+    def _discard(self, entity, x, y):
+        cell = (x, y)
+        cell_entities = self._cells[cell]
+        cell_entities.remove(entity)
+        if len(cell_entities) == 0:
+            del self._cells[cell]
+            bucket = (x // self.bucket_size, y // self.bucket_size)
+            self._buckets[bucket].discard(cell)
+            if len(self._buckets[bucket]) == 0:
+                del self._buckets[bucket]
@@ -0,0 +1,57 @@
+"""Tests that games in separate Sessions don't reach into each other"""
+import os
+import unittest
+
+import keyinput
+import mapgenfuncs
+from session import Session
+from headless import HeadlessColorRegistry
+from gameworld import GameWorld
+from entities import ItemPickup
+from tile import Tile
+
+TESTMAP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "maps", "testmap.map")
+
+class SessionTest(unittest.TestCase):
+
+    def make_game(self):
+        session = Session(color_registry=HeadlessColorRegistry())
+        with open(TESTMAP) as mapfile:
+            gameworld = GameWorld(genfunc=mapgenfuncs.load_from_file, mapfile=mapfile, seed=1, session=session)
+        session.event_bus.deferred = True
+        return session, gameworld
+
+    def play(self, session, gameworld, keys):
+        for key in keys:
+            keyinput.handle_key(key, session)
+            gameworld.update_world()
+            session.event_bus.flush()
+
+    def test_games_run_without_activate(self):
+        session_a, world_a = self.make_game()
+        session_b, world_b = self.make_game()
+
+        #The player starts at 1, 1 and the items lie at 3, 3
+        self.play(session_a, world_a, "nn")
+
+        player_a = world_a._player
+        self.assertEqual((player_a.x, player_a.y), (3, 3))
+        self.assertEqual(len(player_a.inventory), 2)
+        _, entities_a = world_a.get(3, 3)
+        self.assertFalse(any(isinstance(entity, ItemPickup) for entity in entities_a))
+
+        player_b = world_b._player
+        self.assertEqual((player_b.x, player_b.y), (1, 1))
+        self.assertEqual(player_b.inventory, [])
+        _, entities_b = world_b.get(3, 3)
+        self.assertTrue(any(isinstance(entity, ItemPickup) for entity in entities_b))
+
+    def test_each_session_numbers_its_own_colors(self):
+        registry_a = HeadlessColorRegistry()
+        registry_b = HeadlessColorRegistry()
+        red = Tile('r', foreground="RED")
+        green = Tile('g', foreground="GREEN")
+
+        registry_a.tile_colors[red]
+        self.assertNotEqual(registry_a.tile_colors[green], registry_b.tile_colors[green])
+        self.assertEqual(registry_b.tile_colors[green], registry_a.tile_colors[red])
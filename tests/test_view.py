@@ -0,0 +1,27 @@
+"""Tests for the part of the map GameWorld.get_view shows"""
+import unittest
+
+import mapgenfuncs
+from session import Session
+from headless import HeadlessColorRegistry
+from gameworld import GameWorld
+
+class GetViewTest(unittest.TestCase):
+
+    def setUp(self):
+        session = Session(color_registry=HeadlessColorRegistry())
+        #A 6x3 box: a row of floor between two rows of wall
+        self.gameworld = GameWorld(genfunc=mapgenfuncs.empty_box, width=6, height=1, seed=1, session=session)
+
+    def get_chars(self, **kwargs):
+        return ["".join(tile.char for tile in row)
+                for row in self.gameworld.get_view(with_entities=False, **kwargs)]
+
+    def test_whole_map(self):
+        self.assertEqual(self.get_chars(), ["######", "#....#", "######"])
+
+    def test_view_past_the_right_edge_is_cut_off(self):
+        self.assertEqual(self.get_chars(view_width=5, origin=(4, 0)), ["##", ".#", "##"])
+
+    def test_view_past_the_bottom_edge_is_cut_off(self):
+        self.assertEqual(self.get_chars(view_height=3, origin=(0, 2)), ["######"])
@@ -1,25 +1,62 @@
 """This module is for the game's visual elements: Tiles"""
 import curses
+import contextvars
 
-_max_color = 0
-_registered_colors = {}
+class _TileColors(dict):
+    """Maps each tile to its curses color in one ColorRegistry"""
+
+    def __init__(self, registry):
+        super(_TileColors, self).__init__()
+        self._registry = registry
+
+    def __missing__(self, tile):
+        color = self[tile] = self._registry.get_color(tile.foreground, tile.background, tile.bold)
+        return color
+
+class ColorRegistry():
+    """Keeps track of the curses color pairs initialized so far
+
+    tile_colors maps each Tile to its color, looking it up the first time the tile is drawn.
+    """
+
+    def __init__(self):
+        self._max_color = 0
+        self._registered_colors = {}
+        self.tile_colors = _TileColors(self)
+
+    def get_color(self, foreground, background, bold):
+        """Initialize color pairs if necessary and return the curses color"""
+        foreground = parse_color_name(foreground)
+        background = parse_color_name(background)
+        if (foreground, background) in self._registered_colors:
+            c_id = self._registered_colors[(foreground, background)]
+        else:
+            self._max_color += 1
+            c_id = self._max_color
+            curses.init_pair(c_id, foreground, background)
+            self._registered_colors[(foreground, background)] = c_id
+        color_pair = curses.color_pair(c_id)
+        if bold:
+            color_pair += curses.A_BOLD
+        return color_pair
+
+__current_registry = contextvars.ContextVar("color_registry", default=ColorRegistry())
+
+def get_color_registry():
+    """Return the ColorRegistry that get_color uses in the current context"""
+    return __current_registry.get()
+
+def set_color_registry(registry):
+    """Make registry the current ColorRegistry. Return a token for reset_color_registry."""
+    return __current_registry.set(registry)
+
+def reset_color_registry(token):
+    """Go back to the ColorRegistry that was current before set_color_registry"""
+    __current_registry.reset(token)
 
 def get_color(foreground, background, bold):
     """Initialize color pairs if necessary and return the curses color"""
-    global _max_color
-    foreground = parse_color_name(foreground)
-    background = parse_color_name(background)
-    if (foreground, background) in _registered_colors:
-        c_id = _registered_colors[(foreground, background)]
-    else:
-        _max_color += 1
-        c_id = _max_color
-        curses.init_pair(c_id, foreground, background)
-        _registered_colors[(foreground, background)] = c_id
-    color_pair = curses.color_pair(c_id)
-    if bold:
-        color_pair += curses.A_BOLD
-    return color_pair
+    return get_color_registry().get_color(foreground, background, bold)
 
 def parse_color_name(color_str):
     """Return a curses color matching the string, or raise an exception if the string has
@@ -44,8 +81,27 @@ def parse_color_name(color_str):
     raise ValueError("Couldn't find color {0}".format(color_str))
 
 class Tile():
-    """Holds char and color information for some game object's appearance"""
+    """Holds char and color information for some game object's appearance
+
+    Tiles are immutable and interned: asking for the same char and colors twice returns
+    the same Tile. Tiles are shared by every session in the process, so they don't hold a
+    curses color; each session's ColorRegistry looks it up in its tile_colors. That also
+    lets tiles be created (and pickled) in processes that never start curses.
+    """
+    __slots__ = ("char", "foreground", "background", "bold")
+    _interned = {}
+
+    def __new__(cls, char, foreground="WHITE", background="BLACK", bold=False):
+        key = (char, foreground, background, bold)
+        tile = cls._interned.get(key)
+        if tile is None:
+            tile = super(Tile, cls).__new__(cls)
+            tile.char = char
+            tile.foreground = foreground
+            tile.background = background
+            tile.bold = bold
+            cls._interned[key] = tile
+        return tile
 
-    def __init__(self, char, foreground="WHITE", background="BLACK", bold=False):
-        self.char = char
-        self.color = get_color(foreground, background, bold)
+    def __reduce__(self):
+        return (Tile, (self.char, self.foreground, self.background, self.bold))